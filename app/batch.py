@@ -0,0 +1,64 @@
+from app.composition import Composition
+from app.engine import to_tuples
+
+class CompositionBatch:
+    """
+    A set of compositions generated from the same parameters.
+
+    The chord and rhythm sequences are kept as stacked integer arrays and
+    each composition is only built when it is requested.
+
+    Attributes:
+        chord_seqs (ndarray): Chord sequences, shaped (count, measures, k).
+        rhythm_seqs (ndarray): Rhythm sequences, shaped (count, measures, k).
+        params (Params): Parameters shared by every composition, with the seed of the batch.
+        dur_seqs (ndarray): Duration choices, shaped (count, measures, k).
+    """
+
+    def __init__(self, chord_seqs, rhythm_seqs, params, dur_seqs = None):
+        """
+        Initializes the batch with the given sequences and shared parameters.
+
+        Args:
+            chord_seqs (ndarray): Chord sequences, shaped (count, measures, k).
+            rhythm_seqs (ndarray): Rhythm sequences, shaped (count, measures, k).
+            params (Params): The parameters, with the seed used to generate the batch.
+            dur_seqs (ndarray): Duration choices, shaped (count, measures, k).
+        """
+        self.chord_seqs = chord_seqs
+        self.rhythm_seqs = rhythm_seqs
+        self.params = params
+        self.dur_seqs = dur_seqs
+
+    @property
+    def seed(self):
+        return self.params.seed
+
+    def __len__(self):
+        return len(self.chord_seqs)
+
+    def __getitem__(self, index):
+        """
+        Wraps the index-th pair of sequences into a Composition. Its parameters
+        record the seed of the batch and, when the batch holds more than one
+        composition, the index, which reproduce it. The only composition of a
+        batch of one has the parameters `main.generate_piece` records.
+
+        Args:
+            index (int): Position of the composition in the batch.
+        Returns:
+            Composition: The composition at that position.
+        """
+        pars = self.params.to_fields()
+        if len(self) > 1:
+            pars['batch_index'] = str(index)
+
+        return Composition.from_params(self.params,
+                                    to_tuples(self.chord_seqs[index]),
+                                    to_tuples(self.rhythm_seqs[index]),
+                                    pars = pars,
+                                    seed = self.seed,
+                                    dur_seq = None if self.dur_seqs is None else self.dur_seqs[index])
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
@@ -0,0 +1,217 @@
+from app.engine import ExclusionSampler, generate_neighbor, generate_sequence
+
+import json
+import os
+import platform
+import statistics
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+
+# a case slower than its baseline by more than this factor is reported as a regression
+REGRESSION_FACTOR = 1.25
+
+# parameter sweeps of each profile; 'full' goes up to extreme sizes and takes minutes
+SWEEPS = {
+    'quick' : {
+        'neighbor' : [(4, 7, 3), (64, 64, 32)],
+        'sequence' : [(4, 7, 3, 1000), (64, 64, 32, 1000)],
+        'piece' : [{'edo' : 12, 'k' : 7, 'l' : 3, 'measures' : 1000}],
+        'compile' : [1000],
+        'export' : [16],
+        'json' : [1000],
+    },
+    'full' : {
+        'neighbor' : [(2, 3, 0), (4, 7, 3), (16, 7, 6), (64, 64, 32), (1024, 256, 128), (1024, 1024, 0)],
+        'sequence' : [(4, 7, 3, 1000), (4, 7, 3, 100000), (4, 7, 3, 1000000),
+                      (64, 64, 32, 10000), (1024, 512, 256, 10000)],
+        'piece' : [{'edo' : 12, 'k' : 7, 'l' : 3, 'measures' : 10000},
+                   {'edo' : 31, 'k' : 7, 'l' : 3, 'measures' : 10000},
+                   {'edo' : 72, 'k' : 16, 'l' : 8, 'measures' : 10000},
+                   {'edo' : 311, 'k' : 64, 'l' : 32, 'measures' : 10000},
+                   {'edo' : 12, 'k' : 7, 'l' : 3, 'measures' : 10000, 'n_insts' : 32, 'n_timepoints' : '16'},
+                   {'edo' : 12, 'k' : 7, 'l' : 3, 'measures' : 100000}],
+        'compile' : [1000, 10000, 100000],
+        'export' : [16, 64, 256],
+        'json' : [1000, 10000, 100000],
+    },
+}
+
+def make_fields(edo = 12, k = 7, l = 3, measures = 1000, n_insts = 3, beats = 4, n_timepoints = '4'):
+    """
+    Builds parameter fields, as the interface saves them, for a benchmark case.
+    The scale is the chromatic scale of the EDO, so any EDO size is valid.
+    Returns:
+        dict: The parameter fields.
+    """
+    return {'edo_size' : str(edo),
+            'interval_struct' : ' '.join(['1'] * edo),
+            'tonic' : '0',
+            'beats' : str(beats),
+            'base_octaves' : ' '.join(['4'] * n_insts),
+            'inst_weights' : ' '.join(['1'] * (n_insts + 1)),
+            'inst_names' : ['Piano'] * n_insts,
+            'measures' : str(measures),
+            'k' : str(k),
+            'l' : str(l),
+            'n_timepoints' : n_timepoints,
+            'seed' : '0'}
+
+def measure(func, repeat = 3):
+    """
+    Times a function and measures its peak memory.
+    The timed runs are not traced, and one extra traced run gives the peak.
+    Args:
+        func (function): The function, called without arguments.
+        repeat (int): Number of timed runs.
+    Returns:
+        dict: The run times, their median and minimum, in seconds, and the peak
+              traced memory, in bytes.
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    try:
+        func()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    return {'times' : times, 'median' : statistics.median(times), 'min' : min(times), 'peak_bytes' : peak}
+
+def _bench_neighbor(case):
+    n, k, l = case
+    rng = np.random.default_rng(0)
+    weights = [1] * n
+    sampler = ExclusionSampler(weights)
+    node = tuple(rng.integers(1, n + 1, k).tolist())
+    calls = 1000
+
+    def run():
+        for _ in range(calls):
+            generate_neighbor(node, n, k, l, weights, rng, sampler)
+
+    result = measure(run)
+    result['per_call'] = result['median'] / calls
+    return {'n' : n, 'k' : k, 'l' : l, 'calls' : calls}, result
+
+def _bench_sequence(case):
+    n, k, l, measures = case
+    rng = np.random.default_rng(0)
+    repeat = 1 if measures >= 100000 else 3
+    return {'n' : n, 'k' : k, 'l' : l, 'measures' : measures}, \
+           measure(lambda: generate_sequence(n, k, l, measures, rng = rng), repeat)
+
+def _bench_piece(case):
+    from app.main import generate_piece
+
+    fields = make_fields(**case)
+    repeat = 1 if case['measures'] >= 100000 else 3
+    return case, measure(lambda: generate_piece(fields), repeat)
+
+def _bench_compile(measures):
+    from app.main import generate_piece
+
+    composition = generate_piece(make_fields(measures = measures))
+
+    # the event building of play_piece: the event table and the per-part chords and rests
+    def run():
+        events = composition.compile_events()
+        for p in range(1, len(composition.inst_names) + 1):
+            composition.part_events(p, events)
+
+    return {'measures' : measures}, measure(run)
+
+def _bench_export(measures):
+    from app.main import generate_piece
+
+    composition = generate_piece(make_fields(measures = measures))
+    composition.events
+    with tempfile.TemporaryDirectory() as directory:
+        filename = os.path.join(directory, 'bench.xml')
+        return {'measures' : measures}, measure(lambda: composition.export_score(filename), 1)
+
+def _bench_json(measures):
+    from app.main import generate_piece
+    from app.encoder import CompositionEncoder
+    from app.jsonstream import write_composition_json
+    from app.utils import save_json
+
+    composition = generate_piece(make_fields(measures = measures))
+    composition.events
+    with tempfile.TemporaryDirectory() as directory:
+        filename = os.path.join(directory, 'bench.json')
+        encoder = measure(lambda: save_json(filename, composition, encoder = CompositionEncoder))
+        stream = measure(lambda: write_composition_json(composition, filename))
+
+    # the encoder is the reference for comparisons; the streaming writer is kept alongside
+    return {'measures' : measures}, {'median' : encoder['median'], 'peak_bytes' : encoder['peak_bytes'],
+                                     'encoder' : encoder, 'stream' : stream}
+
+BENCHMARKS = {
+    'neighbor' : _bench_neighbor,
+    'sequence' : _bench_sequence,
+    'piece' : _bench_piece,
+    'compile' : _bench_compile,
+    'export' : _bench_export,
+    'json' : _bench_json,
+}
+
+def run_benchmarks(profile = 'quick', only = None, report = None):
+    """
+    Runs the benchmarks of a profile.
+    Args:
+        profile (str): 'quick' or 'full' (see SWEEPS).
+        only (list): Names of the benchmarks to run. All of them if not given.
+        report (function): Optional callback, called with each result as it is measured.
+    Returns:
+        dict: The environment and one result per case, ready to be written as JSON.
+    """
+    results = []
+    for name, cases in SWEEPS[profile].items():
+        if only and name not in only:
+            continue
+        for case in cases:
+            params, result = BENCHMARKS[name](case)
+            entry = {'benchmark' : name, 'params' : params, **result}
+            results.append(entry)
+            if report is not None:
+                report(entry)
+
+    return {'profile' : profile,
+            'timestamp' : time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python' : platform.python_version(),
+            'numpy' : np.__version__,
+            'machine' : platform.machine(),
+            'results' : results}
+
+def case_id(entry):
+    """
+    Identifies a case across result files.
+    Returns:
+        str: The benchmark name and its parameters.
+    """
+    return entry['benchmark'] + json.dumps(entry['params'], sort_keys = True)
+
+def compare(results, baseline, factor = REGRESSION_FACTOR):
+    """
+    Compares results with a baseline file written by an earlier run.
+    Args:
+        results (dict): Results of `run_benchmarks`.
+        baseline (dict): Earlier results.
+        factor (float): Slowdown above which a case counts as a regression.
+    Returns:
+        list: (case id, baseline median, current median) of each regression.
+    """
+    before = {case_id(e) : e['median'] for e in baseline['results']}
+    regressions = []
+    for entry in results['results']:
+        old = before.get(case_id(entry))
+        if old is not None and entry['median'] > old * factor:
+            regressions.append((case_id(entry), old, entry['median']))
+    return regressions
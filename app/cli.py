@@ -0,0 +1,473 @@
+from app.utils import load_json
+from app.profiling import configure_logging, capture
+
+import argparse
+import glob
+import json
+import os
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import tracemalloc
+
+# what a launch loads before doing any work: the command line, the generator and the preset list
+STARTUP_CODE = 'import app.cli, app.main; from app.presets import load_presets; load_presets()'
+
+# memory growth, in bytes, tolerated between the end of the warm-up and the end of a soak run
+SOAK_TOLERANCE = 1024 * 1024
+
+def expand_paths(patterns):
+    """
+    Expands the given paths and glob patterns into a sorted list of files.
+    Args:
+        patterns (list): Paths or glob patterns.
+    Returns:
+        list: The matched filenames, without duplicates.
+    Raises:
+        FileNotFoundError: If a pattern matches no file.
+    """
+    filenames = []
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern))
+        if not matches:
+            raise FileNotFoundError(f'Nenhum arquivo encontrado para "{pattern}".')
+        filenames += [m for m in matches if m not in filenames]
+    return filenames
+
+def output_filenames(par_filename, out_dir, count):
+    """
+    Builds the MusicXML filenames for the compositions generated from a parameter file.
+    Args:
+        par_filename (str): The parameter file.
+        out_dir (str): The output directory.
+        count (int): Number of compositions generated from the file.
+    Returns:
+        list: One '.xml' filename per composition.
+    """
+    stem = os.path.splitext(os.path.basename(par_filename))[0]
+    if count == 1:
+        return [os.path.join(out_dir, f'{stem}.xml')]
+    return [os.path.join(out_dir, f'{stem}_{i+1}.xml') for i in range(count)]
+
+def generate_files(args):
+    """
+    Generates and exports compositions for every parameter file, without a GUI.
+    Args:
+        args (Namespace): Parsed arguments of the 'generate' command.
+    Returns:
+        int: The exit status (0 if every file was exported).
+    """
+    from app.main import generate_batch, export_composition
+
+    os.makedirs(args.out_dir, exist_ok=True)
+    status = 0
+
+    for par_filename in expand_paths(args.params):
+        try:
+            batch = generate_batch(load_json(par_filename), args.count, args.seed)
+            for composition, filename in zip(batch, output_filenames(par_filename, args.out_dir, args.count)):
+                export_composition(composition, filename, use_cache = not args.no_cache)
+                print(filename)
+        except Exception as e:
+            print(f'{par_filename}: {e}', file=sys.stderr)
+            status = 1
+
+    return status
+
+def stream_file(args):
+    """
+    Plays a piece while generating it, measure by measure, until it ends or is interrupted.
+    Args:
+        args (Namespace): Parsed arguments of the 'stream' command.
+    Returns:
+        int: The exit status.
+    """
+    from app.params import Params
+    from app.stream import StreamPlayer
+
+    try:
+        params = Params.from_fields(load_json(args.params))
+    except ValueError as e:
+        print(f'{args.params}: {e}', file=sys.stderr)
+        return 1
+
+    player = StreamPlayer(params, args.tempo, args.measures)
+    try:
+        player.play()
+    except KeyboardInterrupt:
+        player.stop()
+    print(f'{player.played} módulos reproduzidos (semente {player.seed}).')
+    return 0
+
+def measure_startup(args):
+    """
+    Measures the cold-start time of the program in fresh interpreters: importing
+    the command line and the generator and loading the preset list.
+    Args:
+        args (Namespace): Parsed arguments of the 'startup' command.
+    Returns:
+        int: The exit status.
+    """
+    times = []
+    for _ in range(args.runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, '-c', STARTUP_CODE], check=True,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        times.append(time.perf_counter() - start)
+
+    print(f'inicialização: mediana {statistics.median(times):.3f} s, mínimo {min(times):.3f} s ({args.runs} execuções)')
+    return 0
+
+def soak(args):
+    """
+    Plays a composition many times on one session pool, fast-forwarded and with
+    silent parts, and checks that the thread count and the traced memory stay
+    flat after a warm-up of a tenth of the cycles.
+    Args:
+        args (Namespace): Parsed arguments of the 'soak' command.
+    Returns:
+        int: The exit status (0 if the resources stayed flat).
+    """
+    from app.main import generate_piece
+    from app.session import SessionPool
+
+    fields = load_json(args.params)
+    fields['measures'] = str(args.measures)
+    composition = generate_piece(fields)
+    composition.events
+    length = args.measures * composition.beats
+
+    pool = SessionPool(silent = True)
+    warmup = max(1, args.cycles // 10)
+    tracemalloc.start()
+
+    try:
+        for cycle in range(args.cycles):
+            pool.session().fast_forward_in_beats(length)
+            composition.play_piece(pool = pool)
+            if cycle + 1 == warmup:
+                threads, memory = threading.active_count(), tracemalloc.get_traced_memory()[0]
+        end_threads, end_memory = threading.active_count(), tracemalloc.get_traced_memory()[0]
+    finally:
+        pool.close()
+        tracemalloc.stop()
+
+    print(f'threads: {threads} -> {end_threads}')
+    print(f'memória: {memory/1024:.0f} KiB -> {end_memory/1024:.0f} KiB ({args.cycles} ciclos)')
+    return 0 if end_threads <= threads and end_memory - memory <= SOAK_TOLERANCE else 1
+
+def run_bench(args):
+    """
+    Runs the benchmark suite and writes its results as JSON.
+    Args:
+        args (Namespace): Parsed arguments of the 'bench' command.
+    Returns:
+        int: The exit status (1 if a case regressed against the baseline).
+    """
+    from app.bench import run_benchmarks, compare, REGRESSION_FACTOR
+
+    def report(entry):
+        print(f"{entry['benchmark']:10} {json.dumps(entry['params'])}: "
+              f"{entry['median']*1000:.2f} ms, pico {entry['peak_bytes']/1024:.0f} KiB")
+
+    results = run_benchmarks(args.profile, args.benchmarks, report)
+    with open(args.out, 'w') as f:
+        json.dump(results, f, indent=1)
+
+    if args.compare:
+        regressions = compare(results, load_json(args.compare))
+        for case, old, new in regressions:
+            print(f'regressão: {case}: {old*1000:.2f} ms -> {new*1000:.2f} ms', file=sys.stderr)
+        print(f'{len(regressions)} casos mais de {REGRESSION_FACTOR}x mais lentos que {args.compare}')
+        return 1 if regressions else 0
+
+    return 0
+
+def describe_graphs(args):
+    """
+    Prints the invariants of the graphs walked by the chord and rhythm sequences
+    of a parameter file, without generating the piece.
+    Args:
+        args (Namespace): Parsed arguments of the 'graph' command.
+    Returns:
+        int: The exit status (1 if the parameters are invalid or a graph is disconnected).
+    """
+    from app.params import Params
+    from app.graph import TimbralGraph
+
+    try:
+        p = Params.from_fields(load_json(args.params))
+    except ValueError as e:
+        print(f'{args.params}: {e}', file=sys.stderr)
+        return 1
+
+    graphs = {'instrumentos' : TimbralGraph(len(p.inst_names)+1, p.k, p.l, p.inst_weights),
+              'pontos de ataque' : TimbralGraph(p.n_tps, p.k, p.l)}
+
+    status = 0
+    for name, graph in graphs.items():
+        summary = graph.summary()
+        print(f'{name}:')
+        for key, value in summary.items():
+            print(f'  {key}: {value}')
+        if summary['diameter'] is None:
+            print('  aviso: nem todo módulo é alcançável (grafo desconexo)')
+            status = 1
+    return status
+
+def validate_files(args):
+    """
+    Validates parameter files in bulk, with the checks of the interface, without generating.
+    Args:
+        args (Namespace): Parsed arguments of the 'validate' command.
+    Returns:
+        int: The exit status (0 if every file is valid).
+    """
+    from app.params import Params
+
+    start = time.perf_counter()
+    filenames = expand_paths(args.params)
+    invalid = 0
+
+    for filename in filenames:
+        try:
+            Params.from_fields(load_json(filename))
+        except (OSError, ValueError) as e:
+            print(f'{filename}: {e}', file=sys.stderr)
+            invalid += 1
+
+    print(f'{len(filenames) - invalid} de {len(filenames)} arquivos válidos em {(time.perf_counter() - start)*1000:.0f} ms')
+    return 1 if invalid else 0
+
+def run_sweep_command(args):
+    """
+    Sweeps ranges of parameter fields and writes the metrics of every point to a CSV table.
+    Args:
+        args (Namespace): Parsed arguments of the 'sweep' command.
+    Returns:
+        int: The exit status (2 if a range is malformed).
+    """
+    from app.sweep import parse_range, run_sweep, write_table
+
+    try:
+        ranges = dict(parse_range(spec) for spec in args.range)
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 2
+
+    base = load_json(args.params)
+    if args.measures is not None:
+        base['measures'] = str(args.measures)
+
+    start = time.perf_counter()
+    rows = run_sweep(base, ranges, args.count, args.seed, args.jobs)
+    write_table(rows, args.out)
+
+    errors = sum('error' in row for row in rows)
+    print(f'{len(rows)} pontos em {time.perf_counter() - start:.1f} s ({errors} com erro): {args.out}')
+    return 0
+
+def write_midi_files(args):
+    """
+    Writes MIDI files from saved compositions, without rendering scores.
+    Args:
+        args (Namespace): Parsed arguments of the 'midi' command.
+    Returns:
+        int: The exit status (0 if every file was written).
+    """
+    from app.composition import Composition
+
+    os.makedirs(args.out_dir, exist_ok=True)
+    status = 0
+
+    for filename in expand_paths(args.files):
+        out = os.path.join(args.out_dir, os.path.splitext(os.path.basename(filename))[0] + '.mid')
+        try:
+            Composition.load(filename).export_midi(out, args.tempo)
+            print(out)
+        except (OSError, ValueError) as e:
+            print(f'{filename}: {e}', file=sys.stderr)
+            status = 1
+
+    return status
+
+def render_files(args):
+    """
+    Renders saved compositions to WAV files offline, faster than real time.
+    Args:
+        args (Namespace): Parsed arguments of the 'render' command.
+    Returns:
+        int: The exit status (0 if every file was rendered).
+    """
+    from app.composition import Composition
+    from app.render import render_wav, render_stems
+
+    os.makedirs(args.out_dir, exist_ok=True)
+    status = 0
+
+    for filename in expand_paths(args.files):
+        stem = os.path.join(args.out_dir, os.path.splitext(os.path.basename(filename))[0])
+        try:
+            composition = Composition.load(filename)
+            start = time.perf_counter()
+            if args.stems:
+                outputs = render_stems(composition, stem, args.tempo, args.jobs, args.rate)
+            else:
+                outputs = [stem + '.wav']
+                render_wav(composition, outputs[0], args.tempo, samplerate = args.rate)
+            duration = len(composition.chord_seq) * composition.beats * 60 / args.tempo
+            print('\n'.join(outputs))
+            print(f'{duration:.0f} s de música em {time.perf_counter() - start:.1f} s')
+        except ModuleNotFoundError as e:
+            print(e, file=sys.stderr)
+            return 2
+        except (OSError, ValueError) as e:
+            print(f'{filename}: {e}', file=sys.stderr)
+            status = 1
+
+    return status
+
+def build_parser():
+    """
+    Builds the argument parser of the command line.
+    Returns:
+        ArgumentParser: The parser, with one subparser per command.
+    """
+    parser = argparse.ArgumentParser(prog='cli.py', description='Gerador de Fragmentos Timbrais')
+    parser.add_argument('-v', '--verbose', action='count', default=0, help='mostra o tempo de cada etapa (-vv: mensagens de depuração)')
+    parser.add_argument('--capture', choices=['cprofile', 'tracemalloc'], default=None, help='perfila a execução do comando')
+    parser.add_argument('--capture-out', default=None, help='arquivo para as estatísticas do perfil (padrão: resumo no terminal)')
+    commands = parser.add_subparsers(dest='command')
+
+    commands.add_parser('gui', help='abre a interface gráfica (padrão)')
+
+    gen = commands.add_parser('generate', help='gera e exporta composições sem interface gráfica')
+    gen.add_argument('params', nargs='+', help='arquivos de parâmetros (JSON salvo pela interface) ou padrões glob')
+    gen.add_argument('-o', '--out-dir', default='.', help='diretório de saída')
+    gen.add_argument('-n', '--count', type=int, default=1, help='composições geradas por arquivo de parâmetros')
+    gen.add_argument('--seed', type=int, default=None, help='semente do gerador aleatório')
+    gen.add_argument('--no-cache', action='store_true', help='não usa o cache de exportações')
+
+    stream = commands.add_parser('stream', help='reproduz enquanto gera, sem limite de módulos por padrão')
+    stream.add_argument('params', help='arquivo de parâmetros (JSON salvo pela interface)')
+    stream.add_argument('-m', '--measures', type=int, default=None, help='número de módulos (padrão: sem fim)')
+    stream.add_argument('-t', '--tempo', type=int, default=100, help='andamento em bpm')
+
+    startup = commands.add_parser('startup', help='mede o tempo de inicialização do programa')
+    startup.add_argument('-r', '--runs', type=int, default=5, help='número de execuções')
+
+    soak_cmd = commands.add_parser('soak', help='reproduz muitas vezes e verifica se threads e memória ficam estáveis')
+    soak_cmd.add_argument('params', help='arquivo de parâmetros (JSON salvo pela interface)')
+    soak_cmd.add_argument('-c', '--cycles', type=int, default=1000, help='número de reproduções')
+    soak_cmd.add_argument('-m', '--measures', type=int, default=1, help='módulos da composição reproduzida')
+
+    bench = commands.add_parser('bench', help='mede tempo e memória da geração, compilação e exportação')
+    bench.add_argument('-p', '--profile', choices=['quick', 'full'], default='quick', help='conjunto de casos (full chega a tamanhos extremos)')
+    bench.add_argument('-b', '--benchmarks', nargs='+', default=None,
+                       choices=['neighbor', 'sequence', 'piece', 'compile', 'export', 'json'], help='benchmarks executados (padrão: todos)')
+    bench.add_argument('-o', '--out', default='bench.json', help='arquivo JSON com os resultados')
+    bench.add_argument('--compare', default=None, help='resultados anteriores, para detectar regressões')
+
+    midi = commands.add_parser('midi', help='escreve arquivos MIDI de composições salvas (.gft), sem gerar partituras')
+    midi.add_argument('files', nargs='+', help='arquivos .gft ou padrões glob')
+    midi.add_argument('-o', '--out-dir', default='.', help='diretório de saída')
+    midi.add_argument('-t', '--tempo', type=int, default=100, help='andamento em bpm')
+
+    render = commands.add_parser('render', help='renderiza composições salvas (.gft) em WAV, sem tempo real e sem dispositivo de áudio')
+    render.add_argument('files', nargs='+', help='arquivos .gft ou padrões glob')
+    render.add_argument('-o', '--out-dir', default='.', help='diretório de saída')
+    render.add_argument('-t', '--tempo', type=int, default=100, help='andamento em bpm')
+    render.add_argument('--stems', action='store_true', help='um arquivo por instrumento, renderizados em paralelo')
+    render.add_argument('-j', '--jobs', type=int, default=None, help='processos para os stems (padrão: número de CPUs)')
+    render.add_argument('--rate', type=int, default=44100, help='taxa de amostragem')
+
+    graph = commands.add_parser('graph', help='mostra ordem, grau, diâmetro e tempo de mistura dos grafos dos parâmetros')
+    graph.add_argument('params', help='arquivo de parâmetros (JSON salvo pela interface)')
+
+    validate = commands.add_parser('validate', help='valida arquivos de parâmetros em lote, sem gerar')
+    validate.add_argument('params', nargs='+', help='arquivos de parâmetros (JSON salvo pela interface) ou padrões glob')
+
+    sweep = commands.add_parser('sweep', help='varre faixas de parâmetros e tabela métricas das sequências geradas')
+    sweep.add_argument('params', help='arquivo de parâmetros base (JSON salvo pela interface)')
+    sweep.add_argument('-r', '--range', nargs='+', required=True, help='faixas varridas: campo=v1,v2,... ou campo=início..fim')
+    sweep.add_argument('-n', '--count', type=int, default=16, help='sequências geradas por ponto')
+    sweep.add_argument('-m', '--measures', type=int, default=None, help='módulos por sequência (padrão: o do arquivo)')
+    sweep.add_argument('-j', '--jobs', type=int, default=None, help='processos (padrão: número de CPUs)')
+    sweep.add_argument('--seed', type=int, default=0, help='semente da varredura')
+    sweep.add_argument('-o', '--out', default='sweep.csv', help='tabela CSV com uma linha por ponto')
+
+    return parser
+
+def run(argv=None):
+    """
+    Entry point of the command line. Without a command, the GUI is started.
+    Args:
+        argv (list): Command line arguments. Defaults to sys.argv[1:].
+    Returns:
+        int: The exit status.
+    """
+    args = build_parser().parse_args(argv)
+    configure_logging(args.verbose)
+
+    with capture(args.capture, args.capture_out):
+        return run_command(args)
+
+def run_command(args):
+    """
+    Runs the command chosen on the command line.
+    Args:
+        args (Namespace): The parsed arguments.
+    Returns:
+        int: The exit status.
+    """
+    if args.command == 'generate':
+        try:
+            return generate_files(args)
+        except FileNotFoundError as e:
+            print(e, file=sys.stderr)
+            return 2
+
+    if args.command == 'stream':
+        return stream_file(args)
+
+    if args.command == 'startup':
+        return measure_startup(args)
+
+    if args.command == 'soak':
+        return soak(args)
+
+    if args.command == 'bench':
+        return run_bench(args)
+
+    if args.command == 'midi':
+        try:
+            return write_midi_files(args)
+        except FileNotFoundError as e:
+            print(e, file=sys.stderr)
+            return 2
+
+    if args.command == 'render':
+        try:
+            return render_files(args)
+        except FileNotFoundError as e:
+            print(e, file=sys.stderr)
+            return 2
+
+    if args.command == 'graph':
+        return describe_graphs(args)
+
+    if args.command == 'validate':
+        try:
+            return validate_files(args)
+        except FileNotFoundError as e:
+            print(e, file=sys.stderr)
+            return 2
+
+    if args.command == 'sweep':
+        return run_sweep_command(args)
+
+    from app.main import main
+    main()
+    return 0
@@ -1,12 +1,33 @@
-from edopi import TonalSystem, Scale
+from edopi import Scale
 from app.utils import play_part
-from scamp import Session
-from fractions import Fraction
+from app.session import get_pool
+from scamp import Performance, PerformancePart, TempoEnvelope, engraving_settings
+from app.timegrid import time_grid
+from app.pitch import pitch_table
+from app.profiling import Stages
+from itertools import groupby
 
-import random as rd
+import numpy as np
 
 HUNGARIAN_MINOR_SC = Scale(12, (2,1,3,1,1,3,1), tonic = 0, name="Hungarian Minor Scale")
 
+# one row per sounding pitch; chords are rows of the same part sharing onset and duration
+EVENT_DTYPE = np.dtype([('part', np.int16), ('onset', np.int64), ('duration', np.int64), ('pitch', np.float64)])
+
+def draw_durations(grid, shape, rng):
+    """
+    Draws the duration choice of every voice of every measure.
+    The chord attacked by a voice lasts the chosen multiple of its duration unit.
+    
+    Args:
+        grid (TimeGrid): The grid of the composition.
+        shape (tuple): Number of measures and of voices (the shape of `chord_seq`).
+        rng (Generator): NumPy random generator.
+    Returns:
+        ndarray: Indices into `grid.duration_units`.
+    """
+    return rng.integers(len(grid.duration_units), size=shape, dtype=np.uint16)
+
 class Composition:
     """
     A class to represent a musical composition.
@@ -22,7 +43,13 @@ class Composition:
         inst_weights (list): List of weights for each instrument.
         name (str): Name of the composition.
         pars (dict): Dictionary of parameters for the composition.
-        score (Score): The musical score of the composition.
+        seed (int): Seed of the random choices of the composition, if known.
+        dur_seq (ndarray): Duration choice of every voice of every measure, as indices
+            into `grid.duration_units`, shaped like `chord_seq`.
+        score (Score): A SCAMP Score of the composition, if one was built from `to_performance`; export does not need it.
+        stages (Stages): Time spent in each stage of generation, compilation and export.
+        events (ndarray): Compiled event table (see `compile_events`), cached until
+            `chord_seq` or `rhythm_seq` is reassigned.
     """
 
     def __init__(self, 
@@ -35,7 +62,9 @@ class Composition:
                 inst_names = ['Piano'],
                 inst_weights = [70, 30],
                 name = '', 
-                pars = dict()):
+                pars = dict(),
+                seed = None,
+                dur_seq = None):
         """
         Initializes the Composition with the given parameters.
         
@@ -50,6 +79,8 @@ class Composition:
             inst_weights (list): List of weights for each instrument.
             name (str): Name of the composition.
             pars (dict): Dictionary of parameters for the composition.
+            seed (int): Seed of the random choices of the composition.
+            dur_seq (ndarray): Duration choices. If not given, they are drawn from `seed`.
         """
         self.chord_seq = chord_seq
         self.rhythm_seq = rhythm_seq
@@ -62,99 +93,298 @@ class Composition:
 
         self.name = name
         self.pars = pars
+        self.seed = seed
+        self.dur_seq = dur_seq
 
         self.score = None
-    
+        self.stages = Stages()
+
+    @classmethod
+    def from_params(cls, params, chord_seq, rhythm_seq, pars = dict(), seed = None, dur_seq = None):
+        """
+        Builds a composition from sequences and their parameters.
+        
+        Args:
+            params (Params): The parameters (see `app.params`).
+            chord_seq (list): Sequence of chords.
+            rhythm_seq (list): Sequence of rhythms.
+            pars (dict): Parameter fields recorded with the composition.
+            seed (int): Seed of the random choices of the composition.
+            dur_seq (ndarray): Duration choices, as drawn by `draw_durations`.
+        Returns:
+            Composition: The new composition.
+        """
+        return cls(chord_seq, 
+                rhythm_seq, 
+                scale = params.scale, 
+                beats = params.beats,
+                n_timepoints = list(params.n_timepoints),
+                inst_names = list(params.inst_names), 
+                base_pitches = params.base_pitches,
+                inst_weights = list(params.inst_weights),
+                pars = pars,
+                seed = seed,
+                dur_seq = dur_seq)
+
+    @classmethod
+    def load(cls, filename, mmap = True):
+        """
+        Loads a composition saved with `save`, without regenerating or recompiling it.
+        
+        Args:
+            filename (str): The name of the file.
+            mmap (bool): Whether to memory map the sequences and events instead of reading them.
+        Returns:
+            Composition: The loaded composition.
+        """
+        from app.storage import load_composition
+        return load_composition(cls, filename, mmap)
 
-    def export_score(self, filename='test.xml'):
+    def save(self, filename):
         """
-        Exports the musical score to a MusicXML file.
+        Saves the composition in the compact binary format (see `storage`).
+        
+        Args:
+            filename (str): The name of the file.
+        """
+        from app.storage import save_composition
+        save_composition(self, filename)
+
+    @property
+    def chord_seq(self):
+        return self._chord_seq
+
+    @chord_seq.setter
+    def chord_seq(self, value):
+        self._chord_seq = value
+        self._events = None
+
+    @property
+    def rhythm_seq(self):
+        return self._rhythm_seq
+
+    @rhythm_seq.setter
+    def rhythm_seq(self, value):
+        self._rhythm_seq = value
+        self._events = None
+
+    @property
+    def dur_seq(self):
+        """
+        The duration choices, drawn from `seed` on first access if they were not given.
+        """
+        if self._dur_seq is None:
+            self._dur_seq = draw_durations(self.grid, np.shape(self.chord_seq), np.random.default_rng(self.seed))
+        return self._dur_seq
+
+    @dur_seq.setter
+    def dur_seq(self, value):
+        self._dur_seq = value
+        self._events = None
+
+    @property
+    def events(self):
+        """
+        The compiled event table, compiled on first access.
+        """
+        if self._events is None:
+            with self.stages.stage('compile_events'):
+                self._events = self.compile_events()
+            self.stages.count('events', len(self._events))
+        return self._events
+
+    def export_score(self, filename='test.xml', tempo = 100):
+        """
+        Exports the musical score to a MusicXML file, written straight from the
+        compiled events (see `musicxml.write_musicxml`), without a live SCAMP
+        session or a SCAMP Score, so long pieces export in seconds.
         
         Args:
             filename (str): The name of the file to export the score to.
+            tempo (int): The tempo written in the score.
+        """
+        from app.musicxml import write_musicxml
+
+        self.stages.count('notes', len(self.events))
+        with self.stages.stage('export_music_xml'):
+            write_musicxml(self, filename, tempo)
+
+    def export_midi(self, filename, tempo = 100):
+        """
+        Exports the piece to a Standard MIDI File, one track per instrument,
+        straight from the event table (see `midi.write_midi`).
+
+        Args:
+            filename (str): The name of the '.mid' file.
+            tempo (int): The tempo of the file.
+        """
+        from app.midi import write_midi
+        with self.stages.stage('export_midi'):
+            write_midi(self, filename, tempo)
+
+    @property
+    def grid(self):
+        """
+        The TimeGrid shared by every composition with the same measure shape.
         """
-        self.play_piece(advance = True)
-        self.score.export_music_xml(filename)
+        return time_grid(self.beats, self.n_timepoints)
 
-    def play_piece(self, tempo = 100, advance = False):
+    def compile_events(self, start = 0, stop = None):
         """
-        Plays the entire piece using SCAMP.
+        Compiles the chord and rhythm sequences into an event table.
+        The table does not depend on tempo, so playback at any tempo, export and
+        JSON output all reuse it.
         
         Args:
-            tempo (int): The tempo of the piece.
-            advance (bool): Whether to fast forward the session.
+            start (int): First measure to compile.
+            stop (int): Measure after the last one to compile. Defaults to the end.
+        Returns:
+            ndarray: Structured array of EVENT_DTYPE with one row per sounding pitch:
+                     part index (starting at 1), onset and duration in ticks of
+                     `grid` from the start of measure `start`, and MIDI pitch.
+                     Rows are sorted by part and onset.
         """
-        # EDOpi and Scamp
-        edo = TonalSystem(self.scale.system_size)
-        s = Session(tempo = tempo)
+        grid = self.grid
+        n_parts = len(self.inst_names)
 
-        # map index to parts or attack points
-        parts = dict()
-        for i,nm in enumerate(self.inst_names):
-            parts[i+1] = {'inst' : s.new_part(nm), 'base_pitch' : self.base_pitches[i], 'events': []}
-
-        tps = []
-        if len(self.n_timepoints) != 1:
-            for x in self.n_timepoints:
-                for i in range(x):
-                    tps.append(Fraction(1, x))
-        else:
-            tps = [Fraction(1, self.n_timepoints[0]) for _ in range(self.beats * self.n_timepoints[0])]
-                
-        attacks = {x+1 : sum([0] + tps[:x]) for x in range(len(tps))}
-
-        # loop through each measure
-        for voicing, rhythm in zip(self.chord_seq, self.rhythm_seq):
-            # join events and organize by instrument
-            sep_events = {p+1 : [] for p in range(len(self.inst_names))}
-            for i,p in enumerate(voicing):
-                if p in parts.keys():
-                    sep_events[p].append((i, attacks[rhythm[i]]))
+        chords = np.asarray(self.chord_seq[start:stop], dtype=np.int64)
+        rhythms = np.asarray(self.rhythm_seq[start:stop], dtype=np.int64)
+        measure, voice = np.indices(chords.shape)
+
+        # MIDI pitch of each voice of each part
+        pitches = np.stack([pitch_table(self.scale, b, chords.shape[1]) for b in self.base_pitches[:n_parts]])
+
+        # keep only the voices assigned to an instrument, ordered by part, measure and onset
+        played = (chords >= 1) & (chords <= n_parts)
+        part, measure, voice = chords[played], measure[played], voice[played]
+        offset = grid.onsets[rhythms[played] - 1]
+
+        order = np.lexsort((voice, offset, measure, part))
+        part, measure, voice, offset = part[order], measure[order], voice[order], offset[order]
+
+        # voices of the same part attacked together form a chord
+        new_chord = np.ones(len(part), dtype=bool)
+        new_chord[1:] = (part[1:] != part[:-1]) | (measure[1:] != measure[:-1]) | (offset[1:] != offset[:-1])
+        chord_index = np.cumsum(new_chord) - 1
+        starts = np.flatnonzero(new_chord)
+
+        # each chord lasts a fraction, chosen at generation, of the time until the next attack of its part
+        next_offset = np.full(len(starts), grid.measure_ticks, dtype=np.int64)
+        same_measure = (part[starts][1:] == part[starts][:-1]) & (measure[starts][1:] == measure[starts][:-1])
+        next_offset[:-1][same_measure] = offset[starts][1:][same_measure]
+
+        unit = grid.duration_unit(next_offset - offset[starts])
+        choices = np.asarray(self.dur_seq[start:stop], dtype=np.int64)[measure[starts], voice[starts]]
+        durations = unit * grid.duration_units[choices]
+
+        events = np.empty(len(part), dtype=EVENT_DTYPE)
+        events['part'] = part
+        events['onset'] = measure * grid.measure_ticks + offset
+        events['duration'] = durations[chord_index]
+        events['pitch'] = pitches[part-1, voice]
+
+        # the table is shared by every reader of the composition
+        events.setflags(write=False)
+        return events
+
+    def events_in_range(self, start, stop = None):
+        """
+        Returns the events of measures start to stop-1, with onsets counted from
+        the start of measure `start`.
+        If the whole piece is already compiled its table is sliced; otherwise only
+        the requested measures are compiled (and not cached).
         
-            # loop through each instrument
-            for p, events in sep_events.items():
-                if len(events) == 0:
-                    parts[p]['events'].append(('R', self.beats))
-                else:
-                    events.sort(key=lambda x: x[1])
-                    first_event = events[0]
-                    parts[p]['events'].append(('R', first_event[1]))
+        Args:
+            start (int): First measure.
+            stop (int): Measure after the last one. Defaults to the end.
+        Returns:
+            ndarray: Event table of EVENT_DTYPE.
+        """
+        if self._events is None:
+            return self.compile_events(start, stop)
 
-                    cur_event = []
+        measure_ticks = self.grid.measure_ticks
+        stop = len(self.chord_seq) if stop is None else stop
 
-                    for i,e in enumerate(events):
-                        # GRAVE: EDOPI não faz o SCALE.NEXT corretamente
-                        pitch, offset = e
-                        real_pitch = self.scale.next(parts[p]['base_pitch'], pitch)
-                        real_midi_pitch = edo.midi_pitch(real_pitch)
+        onsets = self._events['onset']
+        excerpt = self._events[(onsets >= start * measure_ticks) & (onsets < stop * measure_ticks)]
+        excerpt['onset'] -= start * measure_ticks
+        return excerpt
 
-                        cur_event.append(real_midi_pitch)
+    def part_events(self, p, events = None, length = None):
+        """
+        Groups the compiled events of one part into consecutive chords and rests.
+        
+        Args:
+            p (int): The part index (starting at 1).
+            events (ndarray): Event table to read. Defaults to the whole piece.
+            length (int): Length of `events`, in ticks. Defaults to the whole piece.
+        Returns:
+            list: (pitches, duration) events, where pitches is a list of MIDI pitches
+                  or 'R' for a rest, spanning `length`.
+        """
+        events = self.events if events is None else events
+        events = events[events['part'] == p]
+        total = len(self.chord_seq) * self.grid.measure_ticks if length is None else length
+        to_beats = self.grid.to_beats
 
-                        next_offset = self.beats if i == len(events)-1 else events[i+1][1]
+        grouped = []
+        cur = 0
+        for onset, chord in groupby(events[['onset', 'duration', 'pitch']].tolist(), key=lambda e: e[0]):
+            chord = list(chord)
+            if onset > cur:
+                grouped.append(('R', to_beats(onset - cur)))
+            grouped.append(([e[2] for e in chord], to_beats(chord[0][1])))
+            cur = onset + chord[0][1]
 
-                        if next_offset != offset:
-                            # Change unit measure
-                            time_interval = next_offset - offset
-                            unit = Fraction(time_interval, sum(self.n_timepoints))
-                            available_durs = [x*unit for x in range(1, int(time_interval/unit)+1)]
+        if total > cur:
+            grouped.append(('R', to_beats(total - cur)))
 
-                            dur = rd.choice(available_durs)
-                            rest = time_interval - dur
+        return grouped
 
-                            parts[p]['events'].append((cur_event, dur))
+    def to_performance(self, tempo = 100):
+        """
+        Builds a SCAMP Performance directly from the compiled events, without clocks.
+        
+        Args:
+            tempo (int): The tempo of the performance.
+        Returns:
+            Performance: One part per instrument, with each chord written as
+                         simultaneous notes, as SCAMP transcribes `play_chord`.
+        """
+        performance = Performance(tempo_envelope = TempoEnvelope((tempo,)))
+        events = self.events
+        to_beats = self.grid.to_beats
 
-                            if rest != 0:
-                                parts[p]['events'].append(('R', rest))
+        for p, name in enumerate(self.inst_names, start=1):
+            part = PerformancePart(name = name, instrument_id = (name, self.inst_names[:p-1].count(name)))
+            for _, onset, dur, midi_pitch in events[events['part'] == p].tolist():
+                properties = {'spelling_policy' : engraving_settings.default_spelling_policy}
+                part.new_note(to_beats(onset), to_beats(dur), midi_pitch, 1, properties)
+            performance.add_part(part)
 
-                            cur_event = []
+        return performance
 
-        # playing music with scamp
-        s.start_transcribing()
+    def play_piece(self, tempo = 100, pool = None):
+        """
+        Plays the entire piece using SCAMP, on the parts of a warm session pool.
+        
+        Args:
+            tempo (int): The tempo of the piece.
+            pool (SessionPool): The pool to play on. Defaults to the shared pool.
+        """
+        pool = get_pool() if pool is None else pool
+        s = pool.session(tempo)
+        insts = pool.parts(self.inst_names)
 
-        if advance:
-            s.fast_forward_in_beats(400)
+        parts = dict()
+        with self.stages.stage('part_events'):
+            for p, inst in insts.items():
+                parts[p] = {'inst' : inst, 'events' : self.part_events(p)}
 
-        [s.fork(play_part, args=(parts[i],)) for i in parts.keys()]
-        s.wait_for_children_to_finish()
-        performance = s.stop_transcribing()
-        self.score = performance.to_score(title = 'Parsimonious System')
\ No newline at end of file
+        # playing music with scamp
+        try:
+            [s.fork(play_part, args=(parts[i],)) for i in parts.keys()]
+            s.wait_for_children_to_finish()
+        finally:
+            pool.reset()
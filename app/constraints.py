@@ -0,0 +1,399 @@
+from app.engine import ExclusionSampler, PROGRESS_STEP, _rng
+
+from math import comb
+import numpy as np
+
+# neighbourhood tables kept per sampler; a walk over few symbols revisits the same nodes
+TABLE_CACHE = 1024
+
+class Constraints:
+    """
+    Declarative constraints on the modules of a sequence.
+
+    Attributes:
+        counts (tuple): (symbols, min, max) triples: every module holds between
+                        min and max symbols of the group (max None for no bound).
+        min_distance (int): Least number of positions in which a module differs
+                            from the previous one. Defaults to k - l.
+        max_distance (int): Largest number of such positions. Defaults to k - l.
+        forbidden (frozenset): Modules that never occur.
+        distinct (bool): Whether a module may not repeat the previous one.
+
+    Constraints compare by value and are hashable, so they can be part of cache keys.
+    """
+
+    def __init__(self, counts = (), min_distance = None, max_distance = None, forbidden = (), distinct = False):
+        """
+        Initializes the constraints.
+
+        Args:
+            counts (list): (symbols, min, max) triples; symbols are 1-based.
+            min_distance (int): Least Hamming distance between consecutive modules.
+            max_distance (int): Largest Hamming distance between consecutive modules.
+            forbidden (list): Modules (tuples) that never occur.
+            distinct (bool): Forbids repeating the previous module.
+        """
+        self.counts = tuple((tuple(sorted(set(symbols))), lo, hi) for symbols, lo, hi in counts)
+        self.min_distance = min_distance
+        self.max_distance = max_distance
+        self.forbidden = frozenset(tuple(node) for node in forbidden)
+        self.distinct = distinct
+
+    def _key(self):
+        return (self.counts, self.min_distance, self.max_distance, self.forbidden, self.distinct)
+
+    def __eq__(self, other):
+        return isinstance(other, Constraints) and self._key() == other._key()
+
+    def __hash__(self):
+        return hash(self._key())
+
+    @classmethod
+    def from_dict(cls, d):
+        """
+        Builds constraints from their dictionary form, as stored in a parameter file:
+        {"counts" : [{"symbols" : [1, 2], "min" : 1, "max" : 3}], "min_distance" : 1,
+        "max_distance" : 4, "forbidden" : [[1, 1, 1]], "distinct" : true}, every key optional.
+        """
+        counts = [(c['symbols'], c.get('min', 0), c.get('max')) for c in d.get('counts', [])]
+        return cls(counts, d.get('min_distance'), d.get('max_distance'), d.get('forbidden', []), d.get('distinct', False))
+
+    def to_dict(self):
+        """
+        Returns the dictionary form of the constraints (see `from_dict`).
+        """
+        return {'counts' : [{'symbols' : list(s), 'min' : lo, 'max' : hi} for s, lo, hi in self.counts],
+                'min_distance' : self.min_distance,
+                'max_distance' : self.max_distance,
+                'forbidden' : [list(node) for node in sorted(self.forbidden)],
+                'distinct' : self.distinct}
+
+    def distance_bounds(self, k, l):
+        """
+        Returns the least and largest Hamming distance between consecutive modules.
+        """
+        lo = k - l if self.min_distance is None else self.min_distance
+        hi = k - l if self.max_distance is None else self.max_distance
+        return max(lo, 0), min(hi, k)
+
+    def satisfied_by(self, node, previous = None, l = None):
+        """
+        Checks a module against the constraints.
+        Args:
+            node (tuple): The module.
+            previous (tuple): The previous module, if any.
+            l (int): Number of positions kept by the walk, for the default distance bounds.
+        Returns:
+            bool: Whether the module satisfies every constraint.
+        """
+        if tuple(node) in self.forbidden:
+            return False
+        for symbols, lo, hi in self.counts:
+            c = sum(x in symbols for x in node)
+            if c < lo or (hi is not None and c > hi):
+                return False
+        if previous is not None:
+            h = sum(a != b for a, b in zip(node, previous))
+            dmin, dmax = self.distance_bounds(len(node), len(node) if l is None else l)
+            if (self.distinct and h == 0) or not (l is None or dmin <= h <= dmax):
+                return False
+        return True
+
+class ConstrainedSampler:
+    """
+    Draws modules of a walk directly from its constrained neighbourhood.
+
+    The neighbour of a node follows the distribution of `engine.generate_neighbor`,
+    extended to any number of changed positions in the distance bounds (each
+    count h weighted 1 / C(k, h)), conditioned on the constraints. There is no
+    rejection: positions are drawn one at a time, and a backward table over the
+    states (changed positions, group counts) gives, for every partial module,
+    the total weight of its valid completions. Counts above a group's minimum
+    are merged when the group has no maximum, so the tables stay small whatever
+    the tightness of the bounds. Forbidden modules are removed by subtracting
+    their exact weight along the path.
+
+    Attributes:
+        n (int): Number of symbols.
+        k (int): Size of the modules.
+        constraints (Constraints): The constraints.
+    """
+
+    def __init__(self, n, k, l, weights, constraints):
+        """
+        Compiles the constraints for a walk.
+
+        Args:
+            n (int): Number of symbols.
+            k (int): Size of the modules.
+            l (int): Number of positions kept fixed, for the default distance bounds.
+            weights (list): Weight of each symbol. Uniform if not given.
+            constraints (Constraints): The constraints.
+        Raises:
+            ValueError: If a constraint refers to missing symbols or has empty bounds.
+        """
+        self.n, self.k = n, k
+        self.constraints = constraints
+        self.w = np.asarray(weights if weights else [100/n]*n, dtype=float)
+        self.total = float(self.w.sum())
+        self.dmin, self.dmax = constraints.distance_bounds(k, l)
+
+        if self.dmin > self.dmax:
+            raise ValueError('A distância mínima é maior que a máxima.')
+
+        # axis 0 counts changed positions; one axis per group follows. Axes with a
+        # maximum end with an overflow slab that is always zero; axes without one
+        # saturate at the minimum
+        sizes = [self.dmax + 2]
+        lows, highs = [], []
+        for symbols, lo, hi in constraints.counts:
+            if any(not 1 <= x <= n for x in symbols):
+                raise ValueError(f'Símbolos fora do intervalo 1..{n} em uma restrição.')
+            if lo > k or (hi is not None and lo > hi):
+                raise ValueError(f'Limites de contagem impossíveis: {lo}..{hi}.')
+            if hi is None or hi >= k:
+                sizes.append(lo + 1)
+                highs.append(None)
+            else:
+                sizes.append(hi + 2)
+                highs.append(hi)
+            lows.append(lo)
+        self._up = [np.minimum(np.arange(size) + 1, size - 1) for size in sizes]
+
+        # valid final states: the counts within their bounds and, after a previous
+        # module, the distance within its bounds, each distance h weighted 1 / C(k, h)
+        counts_ok = np.ones(sizes)
+        for axis, (lo, hi) in enumerate(zip(lows, highs), start = 1):
+            idx = np.arange(sizes[axis])
+            ok = (idx == lo) if hi is None else ((idx >= lo) & (idx <= hi))
+            shape = [1] * len(sizes)
+            shape[axis] = sizes[axis]
+            counts_ok = counts_ok * ok.reshape(shape)
+
+        h = np.arange(sizes[0])
+        distance = np.where((h >= self.dmin) & (h <= self.dmax), 1 / np.array([comb(k, min(x, k)) for x in h]), 0.0)
+        self._final = counts_ok * distance.reshape([-1] + [1] * (len(sizes) - 1))
+        # the first module has no previous one, and its distance stays 0
+        self._first_final = counts_ok[:1]
+
+        # symbols sharing the same groups form a class, drawn as a whole and then within
+        signatures = {}
+        for x in range(1, n + 1):
+            sig = tuple(g + 1 for g, (symbols, _, _) in enumerate(constraints.counts) if x in symbols)
+            signatures.setdefault(sig, []).append(x)
+        self._axes = list(signatures)
+        self._members = [members for members in signatures.values()]
+        self._samplers = [ExclusionSampler(self.w[np.array(m) - 1]) for m in self._members]
+        self._class_weight = np.array([float(self.w[np.array(m) - 1].sum()) for m in self._members])
+        self._class_of = np.empty(n + 1, dtype=np.int64)
+        self._local = np.empty(n + 1, dtype=np.int64)
+        for c, members in enumerate(self._members):
+            for i, x in enumerate(members):
+                self._class_of[x], self._local[x] = c, i + 1
+
+        self._tables = {}
+
+    def _pull(self, table, axes):
+        # table[s + delta] for the state delta adding one along each axis
+        for axis in axes:
+            table = table.take(self._up[axis], axis = axis)
+        return table
+
+    def _advance(self, state, axes):
+        state = list(state)
+        for axis in axes:
+            state[axis] = self._up[axis][state[axis]]
+        return tuple(state)
+
+    def _next_state(self, state, x, y):
+        # the state after a position moves from x to y (x is None in the first module)
+        axes = self._axes[self._class_of[y]]
+        return self._advance(state, axes if x is None or x == y else axes + (0,))
+
+    def _class_probs(self, x):
+        # probability of each class for a position that changes from x (or starts, if x is None)
+        if x is None:
+            return self._class_weight / self.total
+        q = self._class_weight.copy()
+        q[self._class_of[x]] -= self.w[x-1]
+        available = self.total - self.w[x-1]
+        return q / available if available > 0 else q * 0
+
+    def _backward(self, node):
+        # tables[i][s]: total weight of the valid completions of positions i..k-1 from state s
+        tables = self._tables.get(node)
+        if tables is not None:
+            return tables
+
+        tables = [self._final if node is not None else self._first_final]
+        for i in reversed(range(self.k)):
+            after = tables[-1]
+            pulled = [self._pull(after, axes) for axes in self._axes]
+            q = self._class_probs(None if node is None else node[i])
+
+            moved = np.zeros_like(after)
+            for qc, p in zip(q, pulled):
+                if qc > 0:
+                    moved += qc * p
+
+            if node is None:
+                tables.append(moved)
+            else:
+                tables.append(pulled[self._class_of[node[i]]] + self._pull(moved, (0,)))
+        tables.reverse()
+
+        if len(self._tables) >= TABLE_CACHE:
+            self._tables.clear()
+        self._tables[node] = tables
+        return tables
+
+    def _step_weight(self, x, y):
+        # weight of position value y given the previous value x (None for the first module)
+        if x is None:
+            return self.w[y-1] / self.total
+        if x == y:
+            return 1.0
+        return self.w[y-1] / (self.total - self.w[x-1])
+
+    def _path_weight(self, tables, node, path, start, state):
+        # weight of the completion path[start:] from `state`
+        weight = 1.0
+        for i in range(start, self.k):
+            x = None if node is None else node[i]
+            weight *= self._step_weight(x, path[i])
+            state = self._next_state(state, x, path[i])
+        return weight * tables[self.k][state]
+
+    def _draw(self, node, u):
+        tables = self._backward(node)
+        state = (0,) * tables[0].ndim
+
+        forbidden = set(self.constraints.forbidden)
+        if node is not None and self.constraints.distinct:
+            forbidden.add(node)
+        active = [t for t in forbidden if len(t) == self.k]
+
+        drawn = []
+        for i in range(self.k):
+            x = None if node is None else node[i]
+            after = tables[i + 1]
+
+            # weight carried by forbidden modules through each symbol, removed from its option
+            removed = {}
+            for t in active:
+                removed[t[i]] = removed.get(t[i], 0.0) + self._path_weight(tables, node, t, i, state)
+
+            # the options are keeping x or moving to one of the classes
+            options = []
+            if x is not None:
+                options.append((after[self._next_state(state, x, x)] - removed.get(x, 0.0), None))
+            for c, qc in enumerate(self._class_probs(x)):
+                if qc > 0:
+                    scale = after[self._advance(state, self._axes[c] + (() if x is None else (0,)))]
+                    taken = sum(r for y, r in removed.items() if y != x and self._class_of[y] == c)
+                    options.append((qc * scale - taken, c))
+            options = [(max(mass, 0.0), choice) for mass, choice in options]
+
+            total = sum(mass for mass, _ in options)
+            if total <= 0:
+                raise ValueError('Nenhum módulo satisfaz as restrições.')
+
+            target = u[2*i] * total
+            for mass, choice in options:
+                if target < mass:
+                    break
+                target -= mass
+
+            y = x if choice is None else self._draw_in_class(choice, x, removed, after, state, u[2*i + 1])
+            drawn.append(y)
+            state = self._next_state(state, x, y)
+            active = [t for t in active if t[i] == y]
+
+        return tuple(drawn)
+
+    def _draw_in_class(self, c, x, removed, after, state, u):
+        # symbols carrying forbidden modules get their reduced weight; the others
+        # are drawn by the class sampler with those symbols (and x) excluded
+        members, sampler = self._members[c], self._samplers[c]
+        scale = after[self._advance(state, self._axes[c] + (() if x is None else (0,)))]
+        available = self.total if x is None else self.total - self.w[x-1]
+
+        special = sorted(y for y in removed if y != x and self._class_of[y] == c)
+        masses = [max(self.w[y-1] / available * scale - removed[y], 0.0) for y in special]
+        excluded = {int(self._local[y]) for y in special}
+        if x is not None and self._class_of[x] == c:
+            excluded.add(int(self._local[x]))
+        excluded = sorted(excluded)
+        rest = max(sampler.total - sum(sampler._w[j-1] for j in excluded), 0.0) / available * scale
+
+        target = u * (sum(masses) + rest)
+        for y, mass in zip(special, masses):
+            if target < mass:
+                return y
+            target -= mass
+
+        local = sampler.sample_excluding_all(excluded, min(target / rest, 1.0) if rest > 0 else 0.0)
+        if local is None:
+            return next(y for y, mass in zip(reversed(special), reversed(masses)) if mass > 0)
+        return members[local - 1]
+
+    def first(self, rng = None):
+        """
+        Draws the first module of a walk.
+        Args:
+            rng (Generator): Optional NumPy random generator.
+        Returns:
+            tuple: A module satisfying the constraints.
+        Raises:
+            ValueError: If no module satisfies them.
+        """
+        rng = _rng if rng is None else rng
+        return self._draw(None, rng.random(2 * self.k))
+
+    def neighbor(self, node, rng = None):
+        """
+        Draws the next module of a walk.
+        Args:
+            node (tuple): The current module.
+            rng (Generator): Optional NumPy random generator.
+        Returns:
+            tuple: A neighbour satisfying the constraints.
+        Raises:
+            ValueError: If no neighbour satisfies them.
+        """
+        rng = _rng if rng is None else rng
+        return self._draw(tuple(node), rng.random(2 * self.k))
+
+def constrained_sequences(n, k, l, measures, weights, constraints, count = 1, rng = None, progress = None):
+    """
+    Constrained version of `engine.generate_sequences`.
+    Args:
+        n (int): Number of symbols.
+        k (int): Size of each tuple.
+        l (int): Number of positions kept fixed between measures, for the default distance bounds.
+        measures (int): Length of each sequence.
+        weights (list): Weight of each symbol. Uniform if not given.
+        constraints (Constraints): The constraints of every module.
+        count (int): Number of sequences.
+        rng (Generator): Optional NumPy random generator.
+        progress (function): Optional callback (see `engine.generate_sequences`).
+    Returns:
+        ndarray: Integer array of shape (count, measures, k).
+    Raises:
+        ValueError: If the constraints cannot be satisfied.
+    """
+    rng = _rng if rng is None else rng
+    sampler = ConstrainedSampler(n, k, l, weights, constraints)
+
+    sequences = np.empty((count, measures, k), dtype=np.int64)
+    for s in range(count):
+        node = sampler.first(rng)
+        sequences[s, 0] = node
+        for m in range(1, measures):
+            node = sampler.neighbor(node, rng)
+            sequences[s, m] = node
+
+            if progress is not None and m % PROGRESS_STEP == 0:
+                progress((s * measures + m) / (count * measures))
+
+    return sequences
@@ -1,9 +1,14 @@
 from json import JSONEncoder
 
+import numpy as np
+
 class CompositionEncoder(JSONEncoder):
     def default(self, obj):
-        dic =  {'instruments' : obj.chord_seq,
-                'timepoints' : obj.rhythm_seq}
+        dic =  {'instruments' : np.asarray(obj.chord_seq).tolist(),
+                'timepoints' : np.asarray(obj.rhythm_seq).tolist(),
+                'durations' : np.asarray(obj.dur_seq).tolist(),
+                'ticks_per_beat' : obj.grid.ticks_per_beat,
+                'events' : obj.events.tolist()}
         for key in obj.pars:
             dic[key] = obj.pars[key]
         
@@ -0,0 +1,397 @@
+from bisect import bisect_right
+
+import numpy as np
+
+_rng = np.random.default_rng()
+
+# measures generated between two progress reports
+PROGRESS_STEP = 1024
+
+# mean draws per step above which walks are drawn measure by measure instead of as streams
+MAX_DRAWS_PER_STEP = 16
+
+def new_seed():
+    """
+    Draws a fresh seed, to be recorded so a random result can be reproduced.
+    Returns:
+        int: A non-negative 63-bit integer.
+    """
+    return int(_rng.integers(2**63))
+
+class ExclusionSampler:
+    """
+    Draws symbols 1..n with probabilities proportional to their weights, with
+    an optional excluded value per draw.
+
+    The tables are built once per weight vector. Excluding the symbol x only
+    shifts every cumulative weight after x by w_x, so the same cumulative
+    table serves every x: a draw maps one uniform sample onto the weights of
+    the other symbols and finds its symbol by binary search, in O(log n)
+    and without building a reduced symbol list.
+
+    Attributes:
+        w (ndarray): Weight of each symbol, symbol i+1 having w[i].
+        cdf (ndarray): Cumulative weights, up to and including each symbol.
+        before (ndarray): Cumulative weights before each symbol.
+        total (float): Sum of the weights.
+        draws_per_step (float): Mean number of independent draws a walk takes
+                                to reach a symbol different from the current one.
+    """
+
+    def __init__(self, weights):
+        """
+        Builds the tables.
+
+        Args:
+            weights (list): Weight of each symbol, symbol i+1 having weights[i].
+        """
+        self.w = np.asarray(weights, dtype=float)
+        self.cdf = np.cumsum(self.w)
+        self.before = np.concatenate(([0.0], self.cdf[:-1]))
+        self.total = float(self.cdf[-1])
+
+        p = self.w / self.total
+        repeat = float(p @ p)
+        self.draws_per_step = 1 / (1 - repeat) if repeat < 1 else float('inf')
+
+        # plain lists for scalar draws, which bisect faster than NumPy indexes single items
+        self._w = self.w.tolist()
+        self._cdf = self.cdf.tolist()
+        self._before = self.before.tolist()
+
+    def __len__(self):
+        return len(self.w)
+
+    def draw(self, u):
+        """
+        Draws symbols from uniform samples.
+        Args:
+            u (ndarray): Uniform samples in [0, 1).
+        Returns:
+            ndarray: The drawn symbols (1-based), with the shape of `u`.
+        """
+        return np.minimum(np.searchsorted(self.cdf, u * self.total, side='right'), len(self.w)-1) + 1
+
+    def draw_excluding(self, values, u):
+        """
+        Draws, for each entry of `values`, a symbol different from that entry.
+        Args:
+            values (ndarray): Current symbols (1-based).
+            u (ndarray): Uniform samples in [0, 1) with the same shape as `values`.
+        Returns:
+            ndarray: The drawn symbols (1-based). Entries whose symbol is the only
+                     one with positive weight are kept unchanged.
+        """
+        x = values - 1
+        wx = self.w[x]
+        available = self.total - wx
+
+        target = u * available
+        target = np.where(target < self.before[x], target, target + wx)
+
+        drawn = np.minimum(np.searchsorted(self.cdf, target, side='right'), len(self.w)-1) + 1
+        return np.where(available > 0, drawn, values)
+
+    def sample(self, u):
+        """
+        Scalar version of `draw`.
+        """
+        return min(bisect_right(self._cdf, u * self.total), len(self._w)-1) + 1
+
+    def sample_excluding(self, x, u):
+        """
+        Scalar version of `draw_excluding`: draws a symbol different from x.
+        Args:
+            x (int): The excluded symbol (1-based).
+            u (float): A uniform sample in [0, 1).
+        Returns:
+            int: The drawn symbol, or x if it is the only one with positive weight.
+        """
+        wx = self._w[x-1]
+        available = self.total - wx
+        if available <= 0:
+            return x
+
+        target = u * available
+        if target >= self._before[x-1]:
+            target += wx
+        return min(bisect_right(self._cdf, target), len(self._w)-1) + 1
+
+    def sample_excluding_all(self, excluded, u):
+        """
+        Draws a symbol outside a set of excluded symbols.
+        Args:
+            excluded (list): The excluded symbols (1-based), sorted and without repetitions.
+            u (float): A uniform sample in [0, 1).
+        Returns:
+            int: The drawn symbol, or None if no symbol outside the set has positive weight.
+        """
+        available = self.total - sum(self._w[x-1] for x in excluded)
+        if available <= 0:
+            return None
+
+        # walking the excluded symbols in order, the target skips each of their intervals
+        target = u * available
+        for x in excluded:
+            if target < self._before[x-1]:
+                break
+            target += self._w[x-1]
+        return min(bisect_right(self._cdf, target), len(self._w)-1) + 1
+
+    def draw_walks(self, start, changes, rng):
+        """
+        Draws independent walks, each step being a symbol different from the
+        previous one, without a loop over the steps.
+
+        Drawing a symbol different from x is the same as drawing symbols until
+        one differs from x, so a walk is a stream of independent draws with its
+        repetitions removed. The streams of every walk are drawn together,
+        a little more than `draws_per_step` per step, and the rare walks left
+        short are topped up in another round.
+        Args:
+            start (ndarray): First symbol (1-based) of each walk.
+            changes (ndarray): Number of steps of each walk.
+            rng (Generator): NumPy random generator.
+        Returns:
+            ndarray: The walks one after the other, each being its first symbol
+                     followed by its steps. A symbol that is the only one with
+                     positive weight is repeated.
+        """
+        start = np.asarray(start, dtype=np.int64)
+        changes = np.asarray(changes, dtype=np.int64)
+
+        lengths = changes + 1
+        offsets = np.cumsum(lengths) - lengths
+        out = np.empty(int(lengths.sum()), dtype=np.int64)
+        out[offsets] = start
+
+        filled = np.zeros_like(changes)
+        current = start.copy()
+        pending = np.flatnonzero(changes)
+        while len(pending):
+            stuck = self.total - self.w[current[pending] - 1] <= 0
+            for q in pending[stuck]:
+                out[offsets[q] + filled[q] + 1 : offsets[q] + lengths[q]] = current[q]
+            filled[pending[stuck]] = changes[pending[stuck]]
+            pending = pending[~stuck]
+            if not len(pending):
+                break
+
+            need = changes[pending] - filled[pending]
+            size = np.ceil(need * min(1.1 * self.draws_per_step, 1e6)).astype(np.int64) + 8
+            block_starts = np.cumsum(size) - size
+            walk = np.repeat(np.arange(len(pending)), size)
+            drawn = self.draw(rng.random(len(walk)))
+
+            # a draw is a step when it differs from the draw before it
+            before = np.empty_like(drawn)
+            before[1:] = drawn[:-1]
+            before[block_starts] = current[pending]
+            step = drawn != before
+            rank = np.cumsum(step)
+            rank -= (rank[block_starts] - step[block_starts])[walk]
+
+            kept = step & (rank <= need[walk])
+            out[(offsets[pending] + filled[pending])[walk[kept]] + rank[kept]] = drawn[kept]
+
+            filled[pending] += np.minimum(rank[block_starts + size - 1], need)
+            current[pending] = out[offsets[pending] + filled[pending]]
+            pending = pending[filled[pending] < changes[pending]]
+
+        return out
+
+def fixed_masks(shape, l, rng):
+    """
+    Chooses, for every row of the last axis, l positions that are kept fixed.
+    Args:
+        shape (tuple): Shape of the mask; the last axis holds the k positions.
+        l (int): Number of fixed positions per row.
+        rng (Generator): NumPy random generator.
+    Returns:
+        ndarray: Boolean mask with exactly l True values per row.
+    """
+    mask = np.zeros(shape, dtype=bool)
+    if l > 0:
+        chosen = np.argsort(rng.random(shape), axis=-1)[..., :l]
+        np.put_along_axis(mask, chosen, True, axis=-1)
+    return mask
+
+def generate_neighbor(node, n, k, l, weights, rng=None, sampler=None, constraints=None):
+    """
+    Draws a neighbor of `node` keeping l random positions and redrawing the
+    others among the remaining n-1 symbols.
+    Args:
+        node (tuple): Current k-tuple of symbols in 1..n.
+        n (int): Number of symbols.
+        k (int): Size of the tuple.
+        l (int): Number of positions kept fixed (parsimony criterion).
+        weights (list): Weight of each symbol.
+        rng (Generator): Optional NumPy random generator.
+        sampler (ExclusionSampler): Sampler built from `weights`, to be reused
+                                    across calls. Built here if not given. With
+                                    constraints, a `ConstrainedSampler` for them.
+        constraints (Constraints): Optional constraints on the neighbor, sampled
+                                   directly from the constrained neighbourhood.
+    Returns:
+        tuple: The neighbor node.
+    Raises:
+        ValueError: If no neighbor satisfies the constraints.
+    """
+    rng = _rng if rng is None else rng
+
+    if constraints is not None:
+        from app.constraints import ConstrainedSampler
+        if not isinstance(sampler, ConstrainedSampler):
+            sampler = ConstrainedSampler(n, k, l, weights, constraints)
+        return sampler.neighbor(node, rng)
+
+    sampler = ExclusionSampler(weights) if sampler is None else sampler
+
+    values = np.asarray(node, dtype=np.int64)
+    drawn = sampler.draw_excluding(values, rng.random(k))
+    neighbor = np.where(fixed_masks((k,), l, rng), values, drawn)
+
+    return tuple(neighbor.tolist())
+
+def generate_sequences(n, k, l, measures, weights=None, count=1, rng=None, progress=None, constraints=None):
+    """
+    Generates `count` independent random walks of `measures` k-tuples over the
+    symbols 1..n, where consecutive tuples share exactly l positions.
+    Every position of every sequence is a walk of its own, which only moves on
+    the measures where the position is not kept. The measures are processed in
+    chunks of PROGRESS_STEP: the walks of a chunk are drawn at once with
+    `ExclusionSampler.draw_walks` and spread over its measures with one gather.
+    When a symbol holds nearly all the weight, so a walk needs more than
+    MAX_DRAWS_PER_STEP draws per step, the chunk is walked measure by measure.
+    Args:
+        n (int): Number of symbols.
+        k (int): Size of each tuple.
+        l (int): Number of positions kept fixed between measures.
+        measures (int): Length of each sequence.
+        weights (list): Weight of each symbol. Uniform if not given.
+        count (int): Number of sequences.
+        rng (Generator): Optional NumPy random generator.
+        progress (function): Optional callback, called with the fraction of measures
+                             generated every PROGRESS_STEP measures. Exceptions it
+                             raises abort the generation.
+        constraints (Constraints): Optional constraints on every module (see
+                                   `constraints.ConstrainedSampler`).
+    Returns:
+        ndarray: Integer array of shape (count, measures, k).
+    Raises:
+        ValueError: If the constraints cannot be satisfied.
+    """
+    rng = _rng if rng is None else rng
+
+    if constraints is not None:
+        from app.constraints import constrained_sequences
+        return constrained_sequences(n, k, l, measures, weights, constraints, count, rng, progress)
+
+    if not weights:
+        weights = [100/n]*n
+
+    sampler = ExclusionSampler(weights)
+
+    sequences = np.empty((count, measures, k), dtype=np.int64)
+    sequences[:, 0] = sampler.draw(rng.random((count, k)))
+
+    for start in range(1, measures, PROGRESS_STEP):
+        stop = min(start + PROGRESS_STEP, measures)
+
+        fixed = fixed_masks((count, stop - start, k), l, rng)
+
+        if sampler.draws_per_step > MAX_DRAWS_PER_STEP:
+            u = rng.random((count, stop - start, k))
+            for m in range(start, stop):
+                drawn = sampler.draw_excluding(sequences[:, m-1], u[:, m-start])
+                sequences[:, m] = np.where(fixed[:, m-start], sequences[:, m-1], drawn)
+        else:
+            # moves of each (sequence, position) walk over the measures of the chunk
+            moves = ~fixed.transpose(0, 2, 1)
+            changes = moves.sum(axis=-1).ravel()
+            walks = sampler.draw_walks(sequences[:, start-1].ravel(), changes, rng)
+
+            # a measure takes the step of its walk reached so far, the walk's start before any move
+            offsets = (np.cumsum(changes + 1) - (changes + 1)).reshape(count, k, 1)
+            steps = np.cumsum(moves, axis=-1)
+            sequences[:, start:stop] = walks[offsets + steps].transpose(0, 2, 1)
+
+        if progress is not None:
+            progress(stop / measures)
+
+    return sequences
+
+def iter_sequence(n, k, l, weights=None, measures=None, rng=None, chunk=256, constraints=None):
+    """
+    Generator version of `generate_sequence`, yielding one k-tuple at a time.
+    Only the current node and one chunk of random numbers are kept in memory,
+    so the walk can run indefinitely.
+    Args:
+        n (int): Number of symbols.
+        k (int): Size of each tuple.
+        l (int): Number of positions kept fixed between measures.
+        weights (list): Weight of each symbol. Uniform if not given.
+        measures (int): Length of the sequence. Endless if not given.
+        rng (Generator): Optional NumPy random generator.
+        chunk (int): Number of measures whose random numbers are drawn together.
+        constraints (Constraints): Optional constraints on every module.
+    Yields:
+        tuple: The next node of the walk.
+    """
+    rng = _rng if rng is None else rng
+
+    if constraints is not None:
+        from app.constraints import ConstrainedSampler
+        sampler = ConstrainedSampler(n, k, l, weights, constraints)
+        node = sampler.first(rng)
+        produced = 1
+        yield node
+        while measures is None or produced < measures:
+            node = sampler.neighbor(node, rng)
+            produced += 1
+            yield node
+        return
+
+    if not weights:
+        weights = [100/n]*n
+
+    sampler = ExclusionSampler(weights)
+
+    node = sampler.draw(rng.random(k))
+    yield tuple(node.tolist())
+
+    produced = 1
+    while measures is None or produced < measures:
+        size = chunk if measures is None else min(chunk, measures - produced)
+        fixed = fixed_masks((size, k), l, rng)
+        u = rng.random((size, k))
+
+        for m in range(size):
+            node = np.where(fixed[m], node, sampler.draw_excluding(node, u[m]))
+            yield tuple(node.tolist())
+
+        produced += size
+
+def to_tuples(sequence):
+    """
+    Converts a (measures, k) array into the list of tuples used by Composition.
+    """
+    return [tuple(node) for node in sequence.tolist()]
+
+def generate_sequence(n, k, l, measures, weights=None, rng=None, progress=None, constraints=None):
+    """
+    Generates a random walk of `measures` k-tuples over the symbols 1..n, where
+    consecutive tuples share exactly l positions.
+    Args:
+        n (int): Number of symbols.
+        k (int): Size of each tuple.
+        l (int): Number of positions kept fixed between measures.
+        measures (int): Length of the sequence.
+        weights (list): Weight of each symbol. Uniform if not given.
+        rng (Generator): Optional NumPy random generator.
+        progress (function): Optional callback (see `generate_sequences`).
+        constraints (Constraints): Optional constraints on every module.
+    Returns:
+        list: The sequence of k-tuples.
+    """
+    return to_tuples(generate_sequences(n, k, l, measures, weights, rng=rng, progress=progress, constraints=constraints)[0])
@@ -0,0 +1,378 @@
+from itertools import combinations, product
+from math import comb, log, ceil
+
+import numpy as np
+
+# largest number of nonzero transitions enumerated into a sparse matrix
+MAX_ENTRIES = 5_000_000
+
+# largest k for the exact spectrum (binomial coefficients beyond it overflow floats)
+MAX_SPECTRUM_K = 1000
+
+class TimbralGraph:
+    """
+    The graph the random walk of `engine.generate_sequence` moves on.
+
+    Nodes are k-tuples over the symbols 1..n. A step keeps l random positions
+    and redraws each of the other d = k-l positions to a different symbol, so
+    two nodes are adjacent exactly when they differ in d positions (the
+    distance-d graph of the Hamming scheme H(k, n)).
+
+    The graph is never built: nodes are indexed in mixed radix, neighbourhoods
+    are generated on demand, and order, degree, diameter, stationary
+    distribution and spectral gap are computed in closed form. Only
+    `transition_matrix` enumerates the graph, for checks on small cases.
+
+    Attributes:
+        n (int): Number of symbols.
+        k (int): Size of the tuples.
+        l (int): Number of positions kept fixed by a step.
+        d (int): Number of positions changed by a step.
+        weights (ndarray): Weight of each symbol.
+    """
+
+    def __init__(self, n, k, l, weights = None):
+        """
+        Initializes the graph.
+
+        Args:
+            n (int): Number of symbols.
+            k (int): Size of the tuples.
+            l (int): Number of positions kept fixed by a step (0 <= l <= k).
+            weights (list): Positive weight of each symbol. Uniform if not given.
+        Raises:
+            ValueError: If the sizes or the weights are invalid.
+        """
+        if n < 1 or k < 1 or not 0 <= l <= k:
+            raise ValueError('É preciso que n >= 1, k >= 1 e 0 <= l <= k.')
+
+        self.n, self.k, self.l = n, k, l
+        self.d = k - l
+        self.weights = np.ones(n) if not weights else np.asarray(weights, dtype=float)
+
+        if len(self.weights) != n or np.any(self.weights <= 0):
+            raise ValueError('É preciso um peso positivo para cada símbolo.')
+
+    # -- indexing --
+
+    @property
+    def order(self):
+        """
+        Number of nodes, n^k.
+        """
+        return self.n ** self.k
+
+    def index(self, node):
+        """
+        Returns the position of a node in the mixed-radix order of all nodes.
+        """
+        i = 0
+        for x in node:
+            i = i * self.n + (x - 1)
+        return i
+
+    def node(self, index):
+        """
+        Returns the node at a given position (the inverse of `index`).
+        """
+        digits = []
+        for _ in range(self.k):
+            index, x = divmod(index, self.n)
+            digits.append(x + 1)
+        return tuple(reversed(digits))
+
+    def neighbors(self, node):
+        """
+        Yields the neighbours of a node, one at a time.
+        """
+        for positions in combinations(range(self.k), self.d):
+            choices = [[y for y in range(1, self.n + 1) if y != node[i]] for i in positions]
+            for values in product(*choices):
+                neighbor = list(node)
+                for i, y in zip(positions, values):
+                    neighbor[i] = y
+                yield tuple(neighbor)
+
+    def transition_probability(self, u, v):
+        """
+        Returns the probability that a step of the walk goes from u to v.
+        """
+        changed = [i for i in range(self.k) if u[i] != v[i]]
+        if len(changed) != self.d:
+            return 0.0
+
+        w, total = self.weights, self.weights.sum()
+        p = 1 / comb(self.k, self.d)
+        for i in changed:
+            p *= w[v[i]-1] / (total - w[u[i]-1])
+        return p
+
+    # -- structure --
+
+    @property
+    def degree(self):
+        """
+        Number of neighbours of every node, C(k, d) (n-1)^d. The graph is regular.
+        """
+        return comb(self.k, self.d) * (self.n - 1) ** self.d
+
+    @property
+    def edges(self):
+        """
+        Number of (undirected) edges.
+        """
+        return self.order * self.degree // 2
+
+    def _reachable_in(self, h, t):
+        # whether t steps can turn a node into one differing from it in h positions:
+        # position i is changed c_i <= t times, sum(c_i) = t*d, and every such
+        # vector of counts is realised by some sequence of d-subsets
+        total = t * self.d
+        if self.n == 2:
+            # a position ends different from the start iff it changed an odd number of times
+            odd_max = t if t % 2 else t - 1
+            even_max = t if t % 2 == 0 else t - 1
+            if h and odd_max < 1:
+                return False
+            return total % 2 == h % 2 and h <= total <= h * odd_max + (self.k - h) * even_max
+
+        # with three or more symbols, a position can end anywhere after two changes,
+        # so differing positions change at least once and equal ones never or twice or more;
+        # with m equal positions changing, m >= d-h keeps every count <= t and h + 2m <= t*d
+        if t == 0:
+            return h == 0
+        if t == 1:
+            return h == self.d
+        return max(0, self.d - h) <= min(self.k - h, (total - h) // 2)
+
+    def distance(self, u, v):
+        """
+        Returns the number of steps between two nodes, or None if v cannot be reached from u.
+        """
+        return self._distance(sum(a != b for a, b in zip(u, v)))
+
+    def _distance(self, h):
+        if self.n == 1:
+            return 0
+        for t in range(2 * self.k + 3):
+            if self._reachable_in(h, t):
+                return t
+        return None
+
+    @property
+    def connected(self):
+        """
+        Whether every node can be reached from every other one.
+        """
+        return self.diameter is not None
+
+    @property
+    def diameter(self):
+        """
+        The largest distance between two nodes, or None if the graph is disconnected.
+        """
+        distances = [self._distance(h) for h in range(self.k + 1)]
+        return None if None in distances else max(distances)
+
+    # -- Markov chain --
+
+    def symbol_distribution(self):
+        """
+        Stationary distribution of one position of the walk.
+        A position that changes moves from x to y with probability w_y / (W - w_x),
+        which is reversible with respect to w_x (W - w_x).
+
+        Returns:
+            ndarray: Probability of each symbol.
+        """
+        w = self.weights
+        pi = w * (w.sum() - w)
+        if pi.sum() == 0:
+            return np.ones(self.n) / self.n
+        return pi / pi.sum()
+
+    def stationary_probability(self, node):
+        """
+        Stationary probability of a node: the product of its symbols' probabilities.
+        """
+        pi = self.symbol_distribution()
+        return float(np.prod([pi[x-1] for x in node]))
+
+    def stationary_distribution(self):
+        """
+        The stationary distribution over all nodes, in the order of `index`.
+        Only feasible for graphs small enough to enumerate.
+
+        Returns:
+            ndarray: Probability of each node.
+        """
+        pi = self.symbol_distribution()
+        dist = np.ones(1)
+        for _ in range(self.k):
+            dist = np.outer(dist, pi).ravel()
+        return dist
+
+    def symbol_spectrum(self):
+        """
+        Eigenvalues of the chain followed by a position when it changes, in
+        decreasing order; the first one is 1.
+        """
+        if self.n == 1:
+            return np.ones(1)
+
+        w = self.weights
+        q = w[np.newaxis, :] / (w.sum() - w)[:, np.newaxis]
+        np.fill_diagonal(q, 0)
+
+        # symmetrised with the reversible distribution, so the eigenvalues are real
+        s = np.sqrt(self.symbol_distribution())
+        sym = s[:, np.newaxis] * q / s[np.newaxis, :]
+        return np.sort(np.linalg.eigvalsh((sym + sym.T) / 2))[::-1]
+
+    def second_eigenvalue(self):
+        """
+        The largest absolute value among the nontrivial eigenvalues of the walk.
+
+        Each eigenvalue of the walk is the mean, over the C(k, d) sets of changed
+        positions, of the product of one eigenvalue of `symbol_spectrum` per
+        position, with at least one nontrivial factor. That mean is affine in each
+        factor, so its extremes only need the smallest and the largest nontrivial
+        symbol eigenvalues and 1: the count of each is enumerated.
+
+        Returns:
+            float: The second largest eigenvalue modulus (1 means no mixing).
+        Raises:
+            ValueError: If k exceeds MAX_SPECTRUM_K.
+        """
+        if self.n == 1 or self.d == 0:
+            return 1.0
+        if self.k > MAX_SPECTRUM_K:
+            raise ValueError(f'O espectro exato só é calculado para k <= {MAX_SPECTRUM_K}.')
+
+        k, d = self.k, self.d
+        spectrum = self.symbol_spectrum()
+        lo, hi = spectrum[-1], spectrum[1]
+
+        # coefficient of z^j in (1+z)^c, for every c
+        ones = [np.array([comb(c, j) for j in range(d + 1)], dtype=float) for c in range(k + 1)]
+
+        best = 0.0
+        poly_lo = np.zeros(d + 1)
+        poly_lo[0] = 1.0
+        for a in range(k + 1):
+            poly = poly_lo.copy()
+            for b in range(k - a + 1):
+                if a + b > 0:
+                    # coefficient of z^d in (1 + lo z)^a (1 + hi z)^b (1 + z)^c
+                    c = k - a - b
+                    e = np.dot(poly, ones[c][::-1])
+                    best = max(best, abs(e) / comb(k, d))
+                poly[1:] = poly[1:] + hi * poly[:-1]
+            poly_lo[1:] = poly_lo[1:] + lo * poly_lo[:-1]
+
+        return float(min(best, 1.0))
+
+    @property
+    def spectral_gap(self):
+        """
+        The absolute spectral gap, 1 minus `second_eigenvalue`.
+        """
+        return 1.0 - self.second_eigenvalue()
+
+    @property
+    def relaxation_time(self):
+        """
+        The relaxation time, 1 / `spectral_gap`, or infinity if the walk does not mix.
+        """
+        gap = self.spectral_gap
+        return float('inf') if gap <= 1e-12 else 1.0 / gap
+
+    def mixing_time(self, eps = 0.25):
+        """
+        Bounds on the number of measures the walk needs to be within total
+        variation distance eps of its stationary distribution, from any start.
+
+        Args:
+            eps (float): The distance.
+        Returns:
+            tuple: Lower and upper bounds (infinity if the walk does not mix).
+        """
+        t_rel = self.relaxation_time
+        if t_rel == float('inf'):
+            return float('inf'), float('inf')
+
+        pi_min = self.symbol_distribution().min() ** self.k
+        lower = (t_rel - 1) * log(1 / (2 * eps))
+        upper = ceil(t_rel * log(1 / (eps * pi_min)))
+        return max(float(lower), 0.0), upper
+
+    # -- enumeration --
+
+    def transition_matrix(self):
+        """
+        Enumerates the walk into a sparse transition matrix, for small graphs.
+
+        Returns:
+            csr_matrix: P[i, j] is the probability of a step from node i to node j.
+        Raises:
+            ValueError: If the graph has more than MAX_ENTRIES transitions.
+        """
+        from scipy.sparse import coo_matrix, identity
+
+        if self.order * self.degree > MAX_ENTRIES:
+            raise ValueError(f'O grafo tem mais de {MAX_ENTRIES} transições para enumerar.')
+
+        # with a single symbol, or no position changing, the walk stays where it is
+        if self.n == 1 or self.d == 0:
+            return identity(self.order, format = 'csr')
+
+        n, k = self.n, self.k
+        w, total = self.weights, self.weights.sum()
+
+        nodes = np.indices((n,) * k).reshape(k, -1).T
+        radix = n ** np.arange(k - 1, -1, -1)
+        rows, cols, probs = [], [], []
+
+        for positions in combinations(range(k), self.d):
+            positions = list(positions)
+            for shifts in product(range(1, n), repeat = self.d):
+                new = nodes.copy()
+                new[:, positions] = (nodes[:, positions] + shifts) % n
+                p = np.prod(w[new[:, positions]] / (total - w[nodes[:, positions]]), axis = 1)
+                rows.append(np.arange(len(nodes)))
+                cols.append(new @ radix)
+                probs.append(p / comb(k, self.d))
+
+        rows, cols, probs = np.concatenate(rows), np.concatenate(cols), np.concatenate(probs)
+        return coo_matrix((probs, (rows, cols)), shape = (self.order, self.order)).tocsr()
+
+    def sparse_stationary_distribution(self):
+        """
+        Computes the stationary distribution numerically from `transition_matrix`,
+        as a check of the closed form of `stationary_distribution`.
+        """
+        from scipy.sparse.linalg import eigs
+
+        if self.order <= 2:
+            p = self.transition_matrix().toarray()
+            values, vectors = np.linalg.eig(p.T)
+            v = np.real(vectors[:, np.argmin(abs(values - 1))])
+        else:
+            _, vectors = eigs(self.transition_matrix().T, k = 1, sigma = 1.0001)
+            v = np.real(vectors[:, 0])
+        return v / v.sum()
+
+    def summary(self):
+        """
+        Returns the structural and Markov invariants of the graph.
+        """
+        summary = {'n' : self.n, 'k' : self.k, 'l' : self.l,
+                   'order' : self.order, 'degree' : self.degree,
+                   'diameter' : self.diameter}
+        try:
+            summary['second_eigenvalue'] = self.second_eigenvalue()
+            summary['relaxation_time'] = self.relaxation_time
+            summary['mixing_time'] = self.mixing_time()
+        except ValueError:
+            pass
+        return summary
@@ -1,2 +1,9 @@
-from app.interface.psginterface import PSGInterface
-from app.interface.tkinterface import TkInterface
\ No newline at end of file
+# backends are imported on first access, so using one never imports the other's toolkit
+def __getattr__(name):
+    if name == 'PSGInterface':
+        from app.interface.psginterface import PSGInterface
+        return PSGInterface
+    if name == 'TkInterface':
+        from app.interface.tkinterface import TkInterface
+        return TkInterface
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
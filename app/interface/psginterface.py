@@ -50,6 +50,9 @@ COLUMNS = {
                 [sg.Text("Resolução por beat:", justification='left')],
                 [sg.Input('4', size = (25,0), key = 'n_timepoints')],
                 [sg.VPush()],
+                [sg.Text("Semente (opcional):", justification='left')],
+                [sg.Input('', size = (25,0), key = 'seed')],
+                [sg.VPush()],
             ],
         }
 
@@ -92,12 +95,26 @@ class PSGInterface(ParsGUIInterface):
         self.cur_event, self.cur_values = self.window.read()
     
     def set_state_to_generating(self):
+        self.window['GEN'].update( disabled = True )
+
+    def set_state_to_generated(self):
+        self.window['GEN'].update( disabled = False )
         self.window['PLAY'].update( disabled = False )
         self.window['EXPORT'].update( disabled = False )
 
         self.window.refresh()
         self.show_popup('Peça finalizada com sucesso!', title = "Geração Concluída")
 
+    def set_state_to_generation_failed(self, msg):
+        self.window['GEN'].update( disabled = False )
+        self.show_popup(msg, title = "Aviso")
+
+    def show_progress(self, fraction):
+        pass
+
+    def post_event(self, event_name):
+        self.window.write_event_value(event_name, None)
+
     def set_state_to_ready(self):
         self.window['PLAY'].update( disabled = False )
         self.window['EXPORT'].update( disabled = False )
@@ -115,6 +132,12 @@ class PSGInterface(ParsGUIInterface):
         self.window['PLAY'].update( disabled = True )
         self.window['EXPORT'].update( disabled = True )
     
+    def set_state_to_paused(self):
+        pass
+
+    def get_play_range(self):
+        return (0, None)
+
     def show_popup(self, msg, title):
         sg.popup(msg, title=title)
     
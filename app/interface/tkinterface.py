@@ -24,6 +24,7 @@ class TkInterface(ParsGUIInterface):
         """
         super().__init__(program_name, sound_presets)
         self.cur_music_thread = None
+        self.playing = False
 
     @property
     def cur_values(self):
@@ -237,6 +238,12 @@ class TkInterface(ParsGUIInterface):
         l3.grid(column=1, row=5, sticky=(N, W, E, S))
         self.widget_vars['n_timepoints'] = StringVar(value="4")
         ttk.Entry(frame, textvariable=self.widget_vars['n_timepoints'], justify='left').grid(column=1, row=6, sticky=(N, W, E))
+        frame.rowconfigure(6, weight=1)
+
+        l4 = ttk.Label(frame, text = "Semente (opcional): ", font="TkFixedFont", padding=f"0 {2*SP} 0 {SP}")
+        l4.grid(column=1, row=7, sticky=(N, W, E, S))
+        self.widget_vars['seed'] = StringVar(value="")
+        ttk.Entry(frame, textvariable=self.widget_vars['seed'], justify='left').grid(column=1, row=8, sticky=(N, W, E))
 
     def create_button_row(self, parent, root):
         """
@@ -254,9 +261,30 @@ class TkInterface(ParsGUIInterface):
         b3 = ttk.Button(parent, text="Exportar", state="disabled", command=lambda : self.window.event_generate("<<EXP_FILE>>"))
         b3.grid(column=3, row=2, padx=SP)
 
+        b4 = ttk.Button(parent, text="Cancelar", state="disabled", command=lambda : self.window.event_generate("<<CANCEL_GEN>>"))
+        b4.grid(column=4, row=2, padx=SP)
+
+        b5 = ttk.Button(parent, text="Pausar", state="disabled", command=lambda : self.window.event_generate("<<PAUSE>>"))
+        b5.grid(column=5, row=2, padx=SP)
+
+        b6 = ttk.Button(parent, text="Parar", state="disabled", command=lambda : self.window.event_generate("<<STOP>>"))
+        b6.grid(column=6, row=2, padx=SP)
+
+        self.progress = DoubleVar(value=0)
+        bar = ttk.Progressbar(parent, variable=self.progress, maximum=1.0, mode="determinate")
+        bar.grid(column=1, row=3, columnspan=6, sticky=(W, E), pady=SP)
+
+        # kept out of widget_vars, so it is not saved with the parameters
+        self.play_range = StringVar(value="")
+        ttk.Label(parent, text="Trecho (módulos): ", font="TkFixedFont").grid(column=1, row=4, columnspan=2, sticky=E)
+        ttk.Entry(parent, textvariable=self.play_range, justify='left').grid(column=3, row=4, columnspan=2, sticky=(W, E))
+
         self.buttons["GEN"] = b1
         self.buttons["PLAY"] = b2
         self.buttons["EXP"] = b3
+        self.buttons["CANCEL"] = b4
+        self.buttons["PAUSE"] = b5
+        self.buttons["STOP"] = b6
     
     def run_mainloop(self):
         """
@@ -316,28 +344,105 @@ class TkInterface(ParsGUIInterface):
     def set_state_to_generating(self):
         """
         Sets the state of the interface to generating.
-        Enables the play and export buttons and shows a popup message.
+        Disables the generate button and enables the cancel button. The play and
+        export buttons keep their state, so the current composition stays usable.
         """
-        self.buttons['PLAY']["state"] = "normal"
-        self.buttons['EXP']["state"] = "normal"
+        self.buttons['GEN']["state"] = "disabled"
+        self.buttons['CANCEL']["state"] = "normal"
+        self.progress.set(0)
+
+    def set_state_to_generated(self):
+        """
+        Sets the state of the interface to generation finished.
+        Enables the generate button, and the play and export buttons unless a
+        playback is running, and shows a popup message.
+        """
+        self.buttons['GEN']["state"] = "normal"
+        self.buttons['CANCEL']["state"] = "disabled"
+        self.progress.set(1)
+
+        if not self.playing:
+            self.buttons['PLAY']["state"] = "normal"
+            self.buttons['EXP']["state"] = "normal"
 
         self.show_popup('Geração Concluída!', title="Aviso")
+
+    def set_state_to_generation_failed(self, msg):
+        """
+        Sets the state of the interface back to ready after a failed or cancelled generation.
+        Args:
+            msg (str): The message to display.
+        """
+        self.buttons['GEN']["state"] = "normal"
+        self.buttons['CANCEL']["state"] = "disabled"
+        self.progress.set(0)
+
+        self.show_popup(msg, title="Aviso")
+
+    def show_progress(self, fraction):
+        """
+        Updates the progress bar.
+        Args:
+            fraction (float): Fraction of the generation done, between 0 and 1.
+        """
+        self.progress.set(fraction)
+
+    def post_event(self, event_name):
+        """
+        Posts an event to the main loop. Safe to call from a background thread.
+        Args:
+            event_name (str): The name of the event.
+        """
+        self.window.event_generate(event_name, when="tail")
     
     def set_state_to_playing(self):
         """
         Sets the state of the interface to playing.
         Disables the play and export buttons.
         """
+        self.playing = True
         self.buttons['PLAY']["state"] = "disabled"
         self.buttons['EXP']["state"] = "disabled"
+        self.buttons['PAUSE'].config(state="normal", text="Pausar")
+        self.buttons['STOP']["state"] = "normal"
+
+    def set_state_to_paused(self):
+        """
+        Sets the state of the interface to paused.
+        The pause button becomes the resume button.
+        """
+        self.buttons['PAUSE'].config(text="Continuar")
     
     def set_state_to_ready(self):
         """
         Sets the state of the interface to ready.
         Enables the play and export buttons.
         """
+        self.playing = False
         self.buttons['PLAY']["state"] = "normal"
         self.buttons['EXP']["state"] = "normal"
+        self.buttons['PAUSE'].config(state="disabled", text="Pausar")
+        self.buttons['STOP']["state"] = "disabled"
+
+    def get_play_range(self):
+        """
+        Reads the range of measures to play, typed as "first last" or as a single
+        measure, counting from 1. An empty field means the whole piece.
+        Returns:
+            tuple: The first measure (from 0) and the measure after the last one
+                   (None for the end of the piece), or None if the field is invalid.
+        """
+        try:
+            bounds = [int(x) for x in self.play_range.get().split()]
+        except ValueError:
+            bounds = None
+
+        if bounds == []:
+            return (0, None)
+        if bounds is None or len(bounds) > 2 or bounds[0] < 1 or bounds[-1] < bounds[0]:
+            self.show_popup("O campo \"Trecho\" deve conter o primeiro e o último módulo, ou um único módulo.", title="Campo Inválido")
+            return None
+        return (bounds[0]-1, bounds[-1])
     
     def set_state_to_saving_parameters(self):
         """
@@ -394,7 +499,7 @@ class TkInterface(ParsGUIInterface):
             audio_func (function): The audio function to run.
             event_name (str): The name of the event to set.
         """
-        thread = threading.Thread(target=lambda:(audio_func(), self.window.event_generate(event_name)), daemon=True)
+        thread = threading.Thread(target=lambda:(audio_func(), self.post_event(event_name)), daemon=True)
         thread.start()
 
     def close_window(self):
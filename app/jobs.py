@@ -0,0 +1,79 @@
+from app.main import generate_piece
+
+import threading
+
+class GenerationCancelled(Exception):
+    pass
+
+class GenerationJob:
+    """
+    A composition generated in the background from a snapshot of the parameters.
+
+    Attributes:
+        params (Params): The parameters, immutable, so later edits in the window
+            do not affect the job.
+        progress (float): Fraction of the generation done, between 0 and 1.
+        result (Composition): The generated composition, with its events already
+            compiled, or None if the job failed or was cancelled.
+        error (Exception): The error that stopped the job, if any.
+        done (bool): Whether the job has finished.
+    """
+
+    def __init__(self, params, on_progress = None):
+        """
+        Initializes the job.
+
+        Args:
+            params (Params): The validated parameters.
+            on_progress (function): Optional callback, called with no arguments
+                whenever `progress` changes.
+        """
+        self.params = params
+        self.on_progress = on_progress
+
+        self.progress = 0.0
+        self.result = None
+        self.error = None
+        self.done = False
+        self._cancel = threading.Event()
+
+    def cancel(self):
+        """
+        Asks the job to stop at its next progress report.
+        """
+        self._cancel.set()
+
+    @property
+    def cancelled(self):
+        return self._cancel.is_set()
+
+    def report(self, fraction):
+        """
+        Records the progress of the generation, aborting it if the job was cancelled.
+
+        Raises:
+            GenerationCancelled: If `cancel` was called.
+        """
+        if self._cancel.is_set():
+            raise GenerationCancelled()
+
+        self.progress = fraction
+        if self.on_progress is not None:
+            self.on_progress()
+
+    def run(self):
+        """
+        Generates the composition and compiles its events, so playback and export
+        of the result start at once. Errors are stored in `error`, not raised.
+        """
+        try:
+            composition = generate_piece(self.params, progress = self.report)
+            composition.events
+            self.report(1.0)
+            self.result = composition
+        except GenerationCancelled:
+            pass
+        except Exception as e:
+            self.error = e
+        finally:
+            self.done = True
@@ -0,0 +1,128 @@
+import json
+import numpy as np
+
+# measures written per chunk; memory use is bounded by this, not by the piece length
+CHUNK = 4096
+
+# the large arrays of a composition file, written one item per line after the other keys
+ARRAY_KEYS = ('instruments', 'timepoints', 'durations', 'events')
+
+def _write_array(f, key, chunks, last = False):
+    f.write(f'{json.dumps(key)}: [\n')
+    first = True
+    for chunk in chunks:
+        if len(chunk) == 0:
+            continue
+        if not first:
+            f.write(',\n')
+        f.write(',\n'.join(json.dumps(item) for item in chunk))
+        first = False
+    f.write('\n]\n' if last else '\n],\n')
+
+def _sequence_chunks(seq, chunk):
+    for start in range(0, len(seq), chunk):
+        yield np.asarray(seq[start:start+chunk]).tolist()
+
+def _event_chunks(composition, chunk):
+    # a compiled table is written as is; otherwise measures are compiled a chunk at a time
+    if composition._events is not None:
+        events = composition._events
+        for start in range(0, len(events), chunk * 16):
+            yield events[start:start + chunk * 16].tolist()
+        return
+
+    measure_ticks = composition.grid.measure_ticks
+    for start in range(0, len(composition.chord_seq), chunk):
+        events = composition.compile_events(start, start + chunk).copy()
+        events['onset'] += start * measure_ticks
+        yield events.tolist()
+
+def write_composition_json(composition, filename, chunk = CHUNK):
+    """
+    Writes a composition as JSON, measure by measure, with the same keys as
+    `CompositionEncoder`. Scalar values come first, one per line, and then each
+    array with one measure (or event) per line, so `iter_json_array` can read
+    it back lazily.
+    Args:
+        composition (Composition): The composition to write.
+        filename (str): The name of the file.
+        chunk (int): Number of measures converted at a time.
+    """
+    with open(filename, 'w') as f:
+        f.write('{\n')
+        f.write(f'"ticks_per_beat": {composition.grid.ticks_per_beat},\n')
+        for key, value in composition.pars.items():
+            if key not in ARRAY_KEYS:
+                f.write(f'{json.dumps(key)}: {json.dumps(value)},\n')
+
+        _write_array(f, 'instruments', _sequence_chunks(composition.chord_seq, chunk))
+        _write_array(f, 'timepoints', _sequence_chunks(composition.rhythm_seq, chunk))
+        _write_array(f, 'durations', _sequence_chunks(composition.dur_seq, chunk))
+        _write_array(f, 'events', _event_chunks(composition, chunk), last = True)
+        f.write('}\n')
+
+def _is_streamed(f):
+    streamed = f.readline() == '{\n'
+    f.seek(0)
+    return streamed
+
+def read_json_header(filename):
+    """
+    Reads the values of a composition JSON file that precede its arrays.
+    Files not written by `write_composition_json` are loaded whole.
+    Args:
+        filename (str): The name of the file.
+    Returns:
+        dict: The scalar values (ticks per beat and the parameters).
+    """
+    with open(filename, 'r') as f:
+        if not _is_streamed(f):
+            return {k : v for k, v in json.load(f).items() if k not in ARRAY_KEYS}
+
+        header = {}
+        f.readline()
+        for line in f:
+            if line.rstrip().endswith('['):
+                break
+            header.update(json.loads('{' + line.rstrip().rstrip(',') + '}'))
+        return header
+
+def iter_json_array(filename, key):
+    """
+    Yields the items of one array of a composition JSON file, reading only one
+    line at a time. Files not written by `write_composition_json` are loaded whole.
+    Args:
+        filename (str): The name of the file.
+        key (str): 'instruments', 'timepoints', 'durations' or 'events'.
+    Yields:
+        list: The next measure (or event) of the array.
+    """
+    with open(filename, 'r') as f:
+        if not _is_streamed(f):
+            yield from json.load(f)[key]
+            return
+
+        opening = f'{json.dumps(key)}: [\n'
+        for line in f:
+            if line == opening:
+                break
+        else:
+            raise KeyError(key)
+
+        for line in f:
+            if line.startswith(']'):
+                return
+            yield json.loads(line.rstrip().rstrip(','))
+
+def iter_measures(filename):
+    """
+    Lazily reads the measures of a composition JSON file.
+    Args:
+        filename (str): The name of the file.
+    Yields:
+        tuple: The chord and rhythm nodes of the next measure.
+    """
+    chords = iter_json_array(filename, 'instruments')
+    rhythms = iter_json_array(filename, 'timepoints')
+    for voicing, rhythm in zip(chords, rhythms):
+        yield tuple(voicing), tuple(rhythm)
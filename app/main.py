@@ -1,27 +1,34 @@
-from app.composition import Composition
-from app.utils import generate_sequence, save_json, load_json
-from app.encoder import CompositionEncoder
+from app.utils import save_json, load_json
+from app.engine import generate_sequence, generate_sequences, new_seed
+from app.params import Params
+from app.jsonstream import write_composition_json
+from app.presets import load_presets
+from app.storage import EXTENSION
 
-from scamp._soundfont_host import get_soundfont_presets
-from edopi import Scale
+import json
+import logging
+import numpy as np
 
-from app.interface import PSGInterface, TkInterface
+log = logging.getLogger(__name__)
 
-import json
+# scamp and edopi (which pulls in matplotlib) are imported inside the functions
+# that need them, so the window opens without loading them
 
-PRESETS = sorted([p.name for p in get_soundfont_presets()])
 PROGRAM_NAME = "Gerador de Fragmentos Timbrais"
 
-composition = Composition(None, None)
+composition = None
+job = None
+controller = None
 
 
 
 # ------------------------------------------ GENERATION ----------------------------------------------------
-def generate_piece(fields):
+def generate_piece(params, progress = None):
     """
     Generates a musical piece based on the provided parameters.
     Args:
-        fields (dict): A dictionary containing the following keys:
+        params (Params): The parameters, or a dictionary of fields, parsed with
+                         `Params.from_fields`, containing the following keys:
             - 'edo_size' (str): Equal division of the octave size.
             - 'interval_struct' (str): Space-separated string of intervals.
             - 'tonic' (str): The tonic note.
@@ -33,62 +40,180 @@ def generate_piece(fields):
             - 'k' (str): Parameter for sequence generation.
             - 'l' (str): Parameter for sequence generation.
             - 'n_timepoints' (str): Space-separated string of timepoints.
+            - 'seed' (str): Optional seed. A new one is drawn if it is missing or empty.
+            - 'constraints' (dict): Optional constraints of the 'instruments' and
+              'timepoints' sequences, in the form of `Constraints.from_dict`.
+        progress (function): Optional callback, called with the fraction of the work
+                             done. Exceptions it raises abort the generation.
     Returns:
-        Composition: An object representing the generated musical piece.
+        Composition: An object representing the generated musical piece, whose
+                     `pars` record the seed, so the same fields always give the same piece.
+    Raises:
+        ValueError: If the fields are invalid.
     """
 
-    edo_size = int(fields['edo_size'])
-    interval_struct = tuple(int(x) for x in fields['interval_struct'].split())
-    tonic = int(fields['tonic'])
+    from app.composition import Composition, draw_durations
+    from app.profiling import Stages
+    from app.timegrid import time_grid
 
-    scale = Scale(edo_size, interval_struct, tonic)
-    beats = int(fields['beats'])
-    base_octaves = [int(x) for x in fields['base_octaves'].split()]
-    base_pitches = [(x*edo_size) + tonic for x in base_octaves]
-    inst_weights = [float(x) for x in fields['inst_weights'].split()]
+    stages = Stages()
+    with stages.stage('parse'):
+        p = Params.coerce(params)
+        seed = new_seed() if p.seed is None else p.seed
+        rng = np.random.default_rng(seed)
 
-    inst_names = fields['inst_names']
-    measures = int(fields['measures'])
-    k = int(fields['k'])
-    l = int(fields['l'])
+    # chords take the first half of the progress, rhythms the second
+    chord_progress = None if progress is None else (lambda f: progress(f/2))
+    rhythm_progress = None if progress is None else (lambda f: progress(0.5 + f/2))
 
-    n_timepoints = [int(x) for x in fields['n_timepoints'].split()]
+    with stages.stage('generate_chords'):
+        chord_seq = generate_sequence(len(p.inst_names)+1, p.k, p.l, p.measures, p.inst_weights, rng = rng, progress = chord_progress,
+                                      constraints = p.chord_constraints)
+    with stages.stage('generate_rhythms'):
+        rhythm_seq = generate_sequence(p.n_tps, p.k, p.l, p.measures, rng = rng, progress = rhythm_progress,
+                                       constraints = p.rhythm_constraints)
+    with stages.stage('draw_durations'):
+        dur_seq = draw_durations(time_grid(p.beats, p.n_timepoints), (p.measures, p.k), rng)
+    stages.count('measures', p.measures)
 
-    n_tps = beats*n_timepoints[0] if len(n_timepoints) == 1 else sum(n_timepoints)
+    composition = Composition.from_params(p, chord_seq, rhythm_seq, pars = p.with_seed(seed).to_fields(), seed = seed, dur_seq = dur_seq)
+    composition.stages = stages
+    log.debug('generated %d measures with seed %d', p.measures, seed)
+    return composition
 
-    chord_seq = generate_sequence(len(inst_names)+1, k, l, measures, inst_weights)
-    rhythm_seq = generate_sequence(n_tps, k, l, measures)
+def generate_batch(params, count, seed = None):
+    """
+    Generates many compositions from the same parameters in one call.
+    The scale is built only once, and all chord and rhythm sequences are drawn
+    together as stacked arrays.
+    Args:
+        params (Params): The parameters, or parameter fields, as accepted by `generate_piece`.
+        count (int): Number of compositions to generate.
+        seed (int): Seed for the random generator. Defaults to the 'seed' field, or a new
+                    seed (recorded in the batch). With count 1, the composition is the
+                    one `generate_piece` gives for the same seed.
+    Returns:
+        CompositionBatch: The generated sequences, shaped (count, measures, k),
+                          which wrap into `Composition` objects on indexing.
+    Raises:
+        ValueError: If the fields are invalid.
+    """
+
+    from app.batch import CompositionBatch
+    from app.composition import draw_durations
+    from app.profiling import Stages
+    from app.timegrid import time_grid
+
+    p = Params.coerce(params)
+    if seed is None:
+        seed = new_seed() if p.seed is None else p.seed
+    rng = np.random.default_rng(seed)
 
-    return Composition(chord_seq, 
-                    rhythm_seq, 
-                    scale = scale, 
-                    beats = beats,
-                    n_timepoints = n_timepoints,
-                    inst_names = inst_names, 
-                    base_pitches = base_pitches,
-                    inst_weights = inst_weights,
-                    pars = fields)
+    stages = Stages()
+    with stages.stage('generate_chords'):
+        chord_seqs = generate_sequences(len(p.inst_names)+1, p.k, p.l, p.measures, p.inst_weights, count, rng,
+                                        constraints = p.chord_constraints)
+    with stages.stage('generate_rhythms'):
+        rhythm_seqs = generate_sequences(p.n_tps, p.k, p.l, p.measures, count = count, rng = rng,
+                                         constraints = p.rhythm_constraints)
+    with stages.stage('draw_durations'):
+        dur_seqs = draw_durations(time_grid(p.beats, p.n_timepoints), chord_seqs.shape, rng)
+    stages.count('measures', count * p.measures)
+
+    log.info('generated %d compositions with seed %d: %s', count, seed, stages)
+    return CompositionBatch(chord_seqs, rhythm_seqs, p.with_seed(seed), dur_seqs = dur_seqs)
 
 def generate(interface):
     """
-    Generates a musical composition based on the provided interface.
-    This function validates the fields of the interface, sets the state to generating,
-    reads the current window values, and generates a musical piece if the fields are valid.
+    Starts generating a musical composition based on the provided interface.
+    This function validates the fields of the interface into a `Params`, sets the state to generating and runs a GenerationJob in the background, so the window
+    stays responsive and the current composition can still be played or exported.
+    Progress is posted as "<<GEN_PROGRESS>>" and the end of the job as "<<GEN_DONE>>".
     Args:
         interface (Interface): An object that provides methods to validate fields,
                                set state, and read current values.
     Returns:
         None
     """
-    global composition
+    global job
+    from app.jobs import GenerationJob
 
-    valid = interface.validate_fields()
-    print(valid)
+    params = interface.validate_fields()
 
-    if valid:
+    if params is not None and (job is None or job.done):
         interface.set_state_to_generating()
-        interface.read_window()
-        composition = generate_piece(interface.cur_values)
+
+        job = GenerationJob(params, on_progress = lambda: interface.post_event("<<GEN_PROGRESS>>"))
+        interface.run_and_set_event(job.run, "<<GEN_DONE>>")
+
+def show_progress(interface):
+    """
+    Shows the progress of the running generation job.
+    """
+    if job is not None:
+        interface.show_progress(job.progress)
+
+def cancel_generation(interface):
+    """
+    Asks the running generation job to stop. The job ends with "<<GEN_DONE>>".
+    """
+    if job is not None:
+        job.cancel()
+
+def finish_generation(interface):
+    """
+    Publishes the result of the finished generation job.
+    The previous composition is replaced, not modified, so a playback started
+    before keeps its own snapshot.
+    """
+    global composition
+
+    if job.result is not None:
+        composition = job.result
+        log.info('generated: %s', composition.stages)
+        interface.set_state_to_generated()
+    elif job.error is not None:
+        log.error('generation failed', exc_info = job.error)
+        interface.set_state_to_generation_failed('Um erro inesperado ocorreu.')
+    else:
+        interface.set_state_to_generation_failed('Geração cancelada.')
+
+def play(interface):
+    """
+    Plays the current composition, or the range of measures chosen in the interface,
+    through a PlaybackController. The composition is captured when playback starts,
+    so generating a new one meanwhile does not affect it.
+    """
+    global controller
+    from app.playback import PlaybackController
+
+    play_range = interface.get_play_range()
+
+    if play_range is not None:
+        controller = PlaybackController(composition, 100, on_end = lambda: interface.post_event("<<END_PLAY>>"))
+        controller.play_range(*play_range)
+        interface.set_state_to_playing()
+
+def toggle_pause(interface):
+    """
+    Pauses the playback, or resumes it if it is paused.
+    """
+    if controller is None:
+        return
+
+    if controller.state == 'paused':
+        controller.resume()
+        interface.set_state_to_playing()
+    elif controller.state == 'playing':
+        controller.pause()
+        interface.set_state_to_paused()
+
+def stop_playback(interface):
+    """
+    Stops the playback. The controller then posts "<<END_PLAY>>".
+    """
+    if controller is not None:
+        controller.stop()
 
 def export_file(interface):
     """
@@ -103,8 +228,48 @@ def export_file(interface):
 
     filename = interface.get_exporting_filename()
             
-    composition.export_score(filename)
-    save_json(f'{filename[:-4]}.json', composition, encoder = CompositionEncoder)
+    export_composition(composition, filename)
+
+def export_composition(composition, filename, tempo = 100, use_cache = True):
+    """
+    Exports the composition score to a MusicXML file, its notes to a MIDI file,
+    and its data to a JSON file and to a binary file (see `storage`) with the
+    same base filename.
+    Artifacts already rendered for the same sequences, parameters and tempo are
+    copied from the render cache instead of being rendered again.
+    Args:
+        composition (Composition): The composition to export.
+        filename (str): The name of the MusicXML file, ending in '.xml'.
+        tempo (int): The tempo written in the score.
+        use_cache (bool): Whether to read and fill the render cache.
+    Returns:
+        bool: Whether every artifact came from the cache.
+    """
+    from app.rendercache import render_key, cached_render, get_render_cache
+
+    cache = get_render_cache() if use_cache else None
+    stem = filename[:-4]
+
+    stages = composition.stages
+    with stages.stage('render_key'):
+        key = render_key(composition, tempo = tempo) if use_cache else None
+
+    def write_json(f):
+        with stages.stage('write_json'):
+            write_composition_json(composition, f)
+
+    def save(f):
+        with stages.stage('save'):
+            composition.save(f)
+
+    hits = [cached_render(cache, key, '.xml', filename, lambda f: composition.export_score(f, tempo)),
+            cached_render(cache, key, '.mid', f'{stem}.mid', lambda f: composition.export_midi(f, tempo)),
+            cached_render(cache, key, '.json', f'{stem}.json', write_json),
+            cached_render(cache, key, EXTENSION, f'{stem}{EXTENSION}', save)]
+    stages.count('cache_hits', sum(hits))
+
+    log.info('exported %s: %s', filename, stages)
+    return all(hits)
 
 def save_pars(interface):
     """
@@ -143,7 +308,7 @@ def load_pars(interface):
     try:
         par_dict = load_json(filename)    
     except Exception as e:
-        print(e)
+        log.exception('could not load parameters')
         interface.show_popup('Um erro inesperado ocorreu.', 'ERRO')
     else:
         interface.update_window(par_dict)
@@ -156,7 +321,12 @@ def main():
     events to their corresponding handlers, and starts the main loop of the interface.
     Event bindings:
     - "<<GEN>>": Binds to the generate function.
-    - "<<PLAY>>": Binds to the interface's play method and triggers the composition to play a piece.
+    - "<<GEN_PROGRESS>>": Binds to the show_progress function.
+    - "<<GEN_DONE>>": Binds to the finish_generation function.
+    - "<<CANCEL_GEN>>": Binds to the cancel_generation function.
+    - "<<PLAY>>": Binds to the play function, which plays a snapshot of the current composition.
+    - "<<PAUSE>>": Binds to the toggle_pause function.
+    - "<<STOP>>": Binds to the stop_playback function.
     - "<<END_PLAY>>": Binds to set the interface state to ready.
     - "<<EXP_FILE>>": Binds to the export_file function.
     - "<<SAVE_PARS>>": Binds to the save_pars function.
@@ -166,15 +336,24 @@ def main():
         None
     """
 
-        
-    interface = TkInterface(PROGRAM_NAME, PRESETS)
+    from app.interface import TkInterface
+    from app.profiling import capture_from_env
+
+    interface = TkInterface(PROGRAM_NAME, load_presets())
 
     interface.external_bind("<<GEN>>", generate, interface)
-    interface.external_bind("<<PLAY>>", interface.play, lambda: composition.play_piece(100), "<<END_PLAY>>")
+    interface.external_bind("<<GEN_PROGRESS>>", show_progress, interface)
+    interface.external_bind("<<GEN_DONE>>", finish_generation, interface)
+    interface.external_bind("<<CANCEL_GEN>>", cancel_generation, interface)
+    interface.external_bind("<<PLAY>>", play, interface)
+    interface.external_bind("<<PAUSE>>", toggle_pause, interface)
+    interface.external_bind("<<STOP>>", stop_playback, interface)
     interface.external_bind("<<END_PLAY>>", interface.set_state_to_ready)
     interface.external_bind("<<EXP_FILE>>", export_file, interface)
     interface.external_bind("<<SAVE_PARS>>", save_pars, interface)
     interface.external_bind("<<LOAD_PARS>>", load_pars, interface)
     interface.external_bind("<<INST_NAMES>>", interface.update_inst_names) 
 
-    interface.run_mainloop()
+    # GFT_CAPTURE=cprofile or tracemalloc profiles the whole session
+    with capture_from_env():
+        interface.run_mainloop()
@@ -0,0 +1,240 @@
+from app.pitch import pitch_table
+
+from tempfile import SpooledTemporaryFile
+
+import logging
+import shutil
+import struct
+import numpy as np
+
+log = logging.getLogger(__name__)
+
+# measures compiled at a time; memory use is bounded by this, not by the piece length
+CHUNK = 4096
+
+# largest division an SMF header can hold in ticks per quarter note
+MAX_DIVISION = 0x7FFF
+
+# division used when the grid resolution does not fit in the header
+FALLBACK_DIVISION = 960
+
+# `play_chord` plays every note at volume 1
+VELOCITY = 127
+
+# the default pitch bend range is two semitones each way
+BEND_CENTER = 8192
+BEND_PER_SEMITONE = 4096
+
+# largest delta time a variable-length quantity can hold; longer gaps are
+# carried by empty text events, which players ignore
+MAX_DELTA = (1 << 28) - 1
+
+# bytes kept in memory per track before spilling to a temporary file
+SPOOL_BYTES = 1024 * 1024
+
+DRUM_CHANNEL = 9
+
+def encode_vlq(values):
+    """
+    Encodes integers as MIDI variable-length quantities.
+    Args:
+        values (ndarray): Non-negative integers below 2^28.
+    Returns:
+        tuple: The encoded bytes of every value, as a (len(values), 4) uint8 array
+               left-aligned, and the number of bytes used by each value.
+    Raises:
+        ValueError: If a value is negative or does not fit in four bytes.
+    """
+    values = np.asarray(values, dtype=np.int64)
+    if len(values) and (values.min() < 0 or values.max() > MAX_DELTA):
+        raise ValueError(f'Valor fora do intervalo de uma quantidade de tamanho variável: {values.min()}..{values.max()}')
+    sizes = 1 + (values >= 1 << 7) + (values >= 1 << 14) + (values >= 1 << 21)
+
+    encoded = np.zeros((len(values), 4), dtype=np.uint8)
+    for j in range(4):
+        shift = 7 * (sizes - 1 - j)
+        used = sizes > j
+        group = (values >> np.where(used, shift, 0)) & 0x7F
+        more = np.where(sizes - 1 > j, 0x80, 0)
+        encoded[:, j] = np.where(used, group | more, 0)
+    return encoded, sizes
+
+def encode_messages(deltas, status, data1, data2):
+    """
+    Encodes a run of three-byte channel messages with their delta times.
+    Deltas longer than MAX_DELTA are split across empty text events.
+    Args:
+        deltas (ndarray): Ticks since the previous message.
+        status (ndarray): Status bytes.
+        data1 (ndarray): First data bytes.
+        data2 (ndarray): Second data bytes.
+    Returns:
+        bytes: The track data of the messages.
+    """
+    deltas = np.asarray(deltas, dtype=np.int64)
+    fill = np.maximum(deltas, 0) // MAX_DELTA
+    vlq, sizes = encode_vlq(deltas - fill * MAX_DELTA)
+    lengths = sizes + 3
+    starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+
+    out = np.empty(int(lengths.sum()), dtype=np.uint8)
+    for j in range(4):
+        used = sizes > j
+        out[starts[used] + j] = vlq[used, j]
+    out[starts + sizes] = status
+    out[starts + sizes + 1] = data1
+    out[starts + sizes + 2] = data2
+    data = out.tobytes()
+
+    if fill.any():
+        pieces, previous = [], 0
+        for i in np.flatnonzero(fill).tolist():
+            pieces += [data[previous:starts[i]], _meta(MAX_DELTA, 0x01, b'') * int(fill[i])]
+            previous = starts[i]
+        data = b''.join(pieces) + data[previous:]
+    return data
+
+def _meta(delta, kind, data):
+    fill, delta = divmod(delta, MAX_DELTA) if delta > MAX_DELTA else (0, delta)
+    if fill:
+        return _meta(MAX_DELTA, 0x01, b'') * fill + _meta(delta, kind, data)
+
+    vlq, sizes = encode_vlq([delta])
+    length, length_size = encode_vlq([len(data)])
+    return vlq[0, :sizes[0]].tobytes() + bytes([0xFF, kind]) + length[0, :length_size[0]].tobytes() + data
+
+def division_for(ticks_per_beat):
+    """
+    Returns the SMF division used for a grid: its own resolution when it fits in
+    the header, or FALLBACK_DIVISION, with times rounded to it, otherwise.
+    """
+    return ticks_per_beat if ticks_per_beat <= MAX_DIVISION else FALLBACK_DIVISION
+
+def part_bends(composition):
+    """
+    Returns the pitch bends each part needs: one per distinct deviation of its
+    pitches from the nearest MIDI note, known in advance from its pitch table.
+    Args:
+        composition (Composition): The composition.
+    Returns:
+        list: For each part, the sorted bend values (BEND_CENTER for none).
+    """
+    k = np.shape(composition.chord_seq)[1]
+    bends = []
+    for base in composition.base_pitches[:len(composition.inst_names)]:
+        table = pitch_table(composition.scale, base, k)
+        bends.append(np.unique(note_and_bend(table)[1]))
+    return bends
+
+def note_and_bend(pitch):
+    """
+    Splits possibly microtonal MIDI pitches into the nearest note and a pitch bend value.
+    """
+    note = np.rint(pitch).astype(np.int64)
+    return note, BEND_CENTER + np.rint((pitch - note) * BEND_PER_SEMITONE).astype(np.int64)
+
+def part_channels(composition):
+    """
+    Assigns MIDI channels to the pitch bends of every part.
+    A part with microtonal pitches gets one channel per distinct bend, set once
+    at the start of its track; the drum channel is skipped.
+    Args:
+        composition (Composition): The composition.
+    Returns:
+        list: For each part, the sorted bend values and the channel of each one.
+    """
+    free = [c for c in range(16) if c != DRUM_CHANNEL]
+
+    channels, used = [], 0
+    for bends in part_bends(composition):
+        channels.append((bends, np.array([free[(used + i) % len(free)] for i in range(len(bends))])))
+        used += len(bends)
+
+    if used > len(free):
+        log.warning('%d channels needed, only %d available: some channels are shared', used, len(free))
+    return channels
+
+def _part_messages(onset, duration, pitch, bends, channels, scale_ticks, last):
+    # note-offs sort before note-ons at the same tick, so repeated notes are not cut
+    note, bend = note_and_bend(pitch)
+    channel = channels[np.searchsorted(bends, bend)]
+
+    on = scale_ticks(onset)
+    off = np.maximum(scale_ticks(onset + duration), on + 1)
+
+    times = np.concatenate((off, on))
+    kinds = np.concatenate((np.zeros(len(on), dtype=np.int64), np.ones(len(on), dtype=np.int64)))
+    notes = np.concatenate((note, note))
+    order = np.lexsort((notes, kinds, times))
+    times, kinds, notes = times[order], kinds[order], notes[order]
+    chans = np.concatenate((channel, channel))[order]
+
+    deltas = np.diff(times, prepend = last)
+    status = np.where(kinds == 1, 0x90, 0x80) | chans
+    velocity = np.where(kinds == 1, VELOCITY, 0)
+    return encode_messages(deltas, status, np.clip(notes, 0, 127), velocity), int(times[-1])
+
+def write_midi(composition, filename, tempo = 100, chunk = CHUNK):
+    """
+    Writes a composition as a Standard MIDI File (format 1): a conductor track
+    with the tempo and time signature, then one track per instrument of
+    `inst_names`, straight from the event table in a single pass over the
+    measures, without transcription or score building.
+    Args:
+        composition (Composition): The composition to write.
+        filename (str): The name of the '.mid' file.
+        tempo (int): The tempo, in beats per minute.
+        chunk (int): Number of measures compiled at a time.
+    """
+    grid = composition.grid
+    tpb = grid.ticks_per_beat
+    division = division_for(tpb)
+    if division == tpb:
+        scale_ticks = lambda t: t
+    else:
+        scale_ticks = lambda t: (t * division + tpb // 2) // tpb
+
+    names = composition.inst_names
+    channels = part_channels(composition)
+    measures = len(composition.chord_seq)
+    end = scale_ticks(np.int64(measures) * grid.measure_ticks)
+
+    tracks = [SpooledTemporaryFile(SPOOL_BYTES) for _ in names]
+    last = [0] * len(names)
+    try:
+        for track, name, (bends, chans) in zip(tracks, names, channels):
+            track.write(_meta(0, 0x03, name.encode('utf-8')))
+            for bend, channel in zip(bends.tolist(), chans.tolist()):
+                if bend != BEND_CENTER:
+                    track.write(bytes([0, 0xE0 | channel, bend & 0x7F, bend >> 7]))
+
+        for start in range(0, measures, chunk):
+            events = composition.events_in_range(start, start + chunk)
+            offset = np.int64(start) * grid.measure_ticks
+            bounds = np.searchsorted(events['part'], np.arange(1, len(names) + 2))
+
+            for p in range(len(names)):
+                part = events[bounds[p]:bounds[p+1]]
+                if len(part) == 0:
+                    continue
+                data, last[p] = _part_messages(part['onset'] + offset, part['duration'], part['pitch'],
+                                               *channels[p], scale_ticks, last[p])
+                tracks[p].write(data)
+
+        with open(filename, 'wb') as f:
+            f.write(b'MThd' + struct.pack('>IHHH', 6, 1, len(names) + 1, division))
+
+            numerator = grid.beats
+            conductor = (_meta(0, 0x51, (60_000_000 // tempo).to_bytes(3, 'big')) +
+                         _meta(0, 0x58, bytes([min(numerator, 255), 2, 24, 8])) +
+                         _meta(int(end), 0x2F, b''))
+            f.write(b'MTrk' + struct.pack('>I', len(conductor)) + conductor)
+
+            for track, t in zip(tracks, last):
+                track.write(_meta(max(int(end) - t, 0), 0x2F, b''))
+                f.write(b'MTrk' + struct.pack('>I', track.tell()))
+                track.seek(0)
+                shutil.copyfileobj(track, f)
+    finally:
+        for track in tracks:
+            track.close()
@@ -0,0 +1,306 @@
+from app.pitch import pitch_table
+
+from functools import lru_cache
+from math import lcm
+from tempfile import SpooledTemporaryFile
+from xml.sax.saxutils import escape
+
+import shutil
+import numpy as np
+
+# measures compiled at a time; memory use is bounded by this, not by the piece length
+CHUNK = 4096
+
+# notated positions per timepoint: note ends are rounded to halves of the gap between timepoints
+SUBDIVISION = 2
+
+# bytes kept in memory per part before spilling to a temporary file
+SPOOL_BYTES = 1024 * 1024
+
+TITLE = 'Parsimonious System'
+
+# note types by number of halvings of a quarter note
+TYPES = ('quarter', 'eighth', '16th', '32nd', '64th', '128th', '256th', '512th', '1024th')
+
+# notated values of whole beats: (beats, type, dots), longest first
+BEAT_VALUES = ((4, 'whole', 0), (3, 'half', 1), (2, 'half', 0), (1, 'quarter', 0))
+
+# spelling of the twelve pitch classes: (step, alter)
+STEPS = (('C', 0), ('C', 1), ('D', 0), ('E', -1), ('E', 0), ('F', 0),
+         ('F', 1), ('G', 0), ('A', -1), ('A', 0), ('B', -1), ('B', 0))
+
+# parts whose pitches lie mostly below this MIDI pitch get the bass clef
+BASS_CLEF_BELOW = 60
+
+HEADER = ('<?xml version="1.0" encoding="UTF-8"?>\n'
+          '<!DOCTYPE score-partwise PUBLIC "-//Recordare//DTD MusicXML 3.1 Partwise//EN" '
+          '"http://www.musicxml.org/dtds/partwise.dtd">\n'
+          '<score-partwise version="3.1">\n')
+
+@lru_cache(maxsize = 4096)
+def pitch_xml(pitch):
+    """
+    Spells a possibly microtonal MIDI pitch as a MusicXML <pitch> element; the
+    deviation from the nearest note goes into a decimal <alter>.
+    """
+    note = round(pitch)
+    step, alter = STEPS[note % 12]
+    alter += round(pitch - note, 4)
+    alter = f'<alter>{alter:g}</alter>' if alter else ''
+    return f'<pitch><step>{step}</step>{alter}<octave>{note // 12 - 1}</octave></pitch>'
+
+@lru_cache(maxsize = None)
+def split_units(units, per_quarter):
+    """
+    Splits a span into notated values, longest first.
+    Args:
+        units (int): Length of the span, in units.
+        per_quarter (int): Units in a nominal quarter note, a power of two.
+    Returns:
+        tuple: (units, type, dots) of each value. The type is None for values
+               shorter than a 1024th note.
+    """
+    values = []
+    while units:
+        b = 1 << (units.bit_length() - 1)
+        size, dots = (b + b // 2, 1) if b > 1 and units & (b >> 1) else (b, 0)
+        halvings = (per_quarter // b).bit_length() - 1
+        values.append((size, TYPES[halvings] if halvings < len(TYPES) else None, dots))
+        units -= size
+    return tuple(values)
+
+class Layout:
+    """
+    How the measures of a grid are notated.
+
+    Beat b is split into SUBDIVISION * r units, r being its resolution. Beats
+    whose resolution is not a power of two are r:p tuplets, p being the largest
+    power of two below r.
+
+    Attributes:
+        beats (int): Number of beats per measure.
+        divisions (int): MusicXML divisions per quarter note (one quarter per beat).
+        starts (list): First unit of each beat, and the number of units of the measure.
+        units (ndarray): Units of each beat.
+        unit_divisions (list): Divisions of a unit of each beat.
+        per_quarter (list): Units of each beat in a nominal quarter note.
+        tuplets (list): (r, p) of each beat, or None for a beat without tuplet.
+    """
+
+    def __init__(self, grid):
+        """
+        Builds the layout of a grid.
+
+        Args:
+            grid (TimeGrid): The grid of the composition.
+        """
+        self.grid = grid
+        self.beats = grid.beats
+        resolutions = grid.n_timepoints if len(grid.n_timepoints) != 1 else grid.n_timepoints * grid.beats
+
+        self.units = np.array([SUBDIVISION * r for r in resolutions], dtype = np.int64)
+        self.divisions = lcm(*self.units.tolist())
+        self.starts = np.concatenate(([0], np.cumsum(self.units))).tolist()
+        self.unit_divisions = [self.divisions // int(u) for u in self.units]
+
+        powers = [1 << (r.bit_length() - 1) for r in resolutions]
+        self.per_quarter = [SUBDIVISION * p for p in powers]
+        self.tuplets = [None if r == p else (r, p) for r, p in zip(resolutions, powers)]
+
+        self._first = np.array(self.starts[:-1], dtype = np.int64)
+
+    def to_units(self, ticks):
+        """
+        Rounds positions in a measure, in ticks, to the nearest unit.
+        """
+        tpb = self.grid.ticks_per_beat
+        beat = np.minimum(ticks // tpb, self.beats - 1)
+        return self._first[beat] + ((ticks - beat * tpb) * self.units[beat] + tpb // 2) // tpb
+
+    def beat_of(self, unit):
+        """
+        Returns the beat holding a unit.
+        """
+        beat = 0
+        while self.starts[beat + 1] <= unit:
+            beat += 1
+        return beat
+
+def _pieces(a, z, layout):
+    # notated values of the span [a, z) of units: (divisions, type, dots, tuplet beat or None)
+    starts = layout.starts
+    pieces = []
+    whole = 0
+
+    beat = layout.beat_of(a)
+    while a < z:
+        end = min(z, starts[beat + 1])
+        if a == starts[beat] and end == starts[beat + 1]:
+            whole += 1
+        else:
+            pieces += _whole_beats(whole, layout.divisions)
+            whole = 0
+            tuplet = None if layout.tuplets[beat] is None else beat
+            pieces += [(size * layout.unit_divisions[beat], kind, dots, tuplet)
+                       for size, kind, dots in split_units(end - a, layout.per_quarter[beat])]
+        a = end
+        beat += 1
+
+    return pieces + _whole_beats(whole, layout.divisions)
+
+def _whole_beats(count, divisions):
+    pieces = []
+    for beats, kind, dots in BEAT_VALUES:
+        while count >= beats:
+            pieces.append((beats * divisions, kind, dots, None))
+            count -= beats
+    return pieces
+
+def _measure_notes(u0, u1, pitches, layout):
+    # the <note> elements of one measure of one part, from its chords in units
+    total = layout.starts[-1]
+    spans, cur = [], 0
+    for a, z, chord in zip(u0, u1, pitches):
+        if a > cur:
+            spans.append((cur, a, None))
+        spans.append((a, z, chord))
+        cur = z
+    if cur < total:
+        spans.append((cur, total, None))
+
+    if len(spans) == 1 and spans[0][2] is None:
+        return f'<note><rest measure="yes"/><duration>{layout.beats * layout.divisions}</duration><voice>1</voice></note>\n'
+
+    notes = []
+    for a, z, chord in spans:
+        pieces = _pieces(a, z, layout)
+        for i, (divs, kind, dots, tuplet) in enumerate(pieces):
+            notes.append((chord, divs, kind, dots, tuplet, i > 0, i < len(pieces) - 1))
+
+    out = []
+    for i, (chord, divs, kind, dots, tuplet, tie_stop, tie_start) in enumerate(notes):
+        ties, tied = '', ''
+        if chord is not None and tie_stop:
+            ties += '<tie type="stop"/>'
+            tied += '<tied type="stop"/>'
+        if chord is not None and tie_start:
+            ties += '<tie type="start"/>'
+            tied += '<tied type="start"/>'
+
+        value = '<voice>1</voice>'
+        if kind is not None:
+            value += f'<type>{kind}</type>' + '<dot/>' * dots
+        bracket = ''
+        if tuplet is not None:
+            r, p = layout.tuplets[tuplet]
+            value += f'<time-modification><actual-notes>{r}</actual-notes><normal-notes>{p}</normal-notes></time-modification>'
+            # a tuplet bracket spans the pieces of its beat
+            if i == 0 or notes[i-1][4] != tuplet:
+                bracket += '<tuplet type="start" bracket="yes"/>'
+            if i == len(notes) - 1 or notes[i+1][4] != tuplet:
+                bracket += '<tuplet type="stop"/>'
+
+        head = f'<duration>{divs}</duration>{ties}{value}'
+        first = f'{head}<notations>{tied}{bracket}</notations></note>\n' if tied or bracket else f'{head}</note>\n'
+        if chord is None:
+            out.append('<note><rest/>' + first)
+        else:
+            # ties belong to every note of a chord, the tuplet bracket to its first note
+            rest = f'{head}<notations>{tied}</notations></note>\n' if tied else f'{head}</note>\n'
+            out.append('<note>' + chord[0] + first)
+            out += ['<note><chord/>' + pitch + rest for pitch in chord[1:]]
+
+    return ''.join(out)
+
+def part_names(names):
+    """
+    Numbers repeated instrument names, as SCAMP does: 'Piano', 'Piano [2]'.
+    """
+    return [name if names[:i].count(name) == 0 else f'{name} [{names[:i].count(name) + 1}]'
+            for i, name in enumerate(names)]
+
+def _attributes(layout, clef, tempo):
+    sign, line = ('F', 4) if clef == 'bass' else ('G', 2)
+    xml = (f'<attributes><divisions>{layout.divisions}</divisions><key><fifths>0</fifths></key>'
+           f'<time><beats>{layout.beats}</beats><beat-type>4</beat-type></time>'
+           f'<clef><sign>{sign}</sign><line>{line}</line></clef></attributes>\n')
+    if tempo is not None:
+        xml += ('<direction placement="above"><direction-type><metronome><beat-unit>quarter</beat-unit>'
+                f'<per-minute>{tempo}</per-minute></metronome></direction-type><sound tempo="{tempo}"/></direction>\n')
+    return xml
+
+def write_musicxml(composition, filename, tempo = 100, chunk = CHUNK):
+    """
+    Writes the score of a composition as a MusicXML (partwise) file, straight
+    from the event table in a single pass over the measures, without building a
+    SCAMP Score. Each part is one voice: chords keep their onsets, on the
+    timepoints, and their ends are rounded to the nearest half of a gap between
+    timepoints (see `Layout`).
+    Args:
+        composition (Composition): The composition to write.
+        filename (str): The name of the '.xml' file.
+        tempo (int): The tempo written in the score.
+        chunk (int): Number of measures compiled at a time.
+    """
+    grid = composition.grid
+    layout = Layout(grid)
+    names = composition.inst_names
+    measures = len(composition.chord_seq)
+    k = np.shape(composition.chord_seq)[1]
+
+    clefs = ['bass' if np.median(pitch_table(composition.scale, base, k)) < BASS_CLEF_BELOW else 'treble'
+             for base in composition.base_pitches[:len(names)]]
+
+    parts = [SpooledTemporaryFile(SPOOL_BYTES) for _ in names]
+    try:
+        for start in range(0, measures, chunk):
+            events = composition.events_in_range(start, start + chunk)
+            count = min(chunk, measures - start)
+            bounds = np.searchsorted(events['part'], np.arange(1, len(names) + 2))
+
+            for p in range(len(names)):
+                part = events[bounds[p]:bounds[p+1]]
+
+                # chords are the rows of a part sharing an onset
+                first = np.ones(len(part), dtype = bool)
+                first[1:] = part['onset'][1:] != part['onset'][:-1]
+                onset = part['onset'][first]
+                measure = onset // grid.measure_ticks
+                offset = onset - measure * grid.measure_ticks
+
+                u0 = layout.to_units(offset)
+                u1 = np.maximum(layout.to_units(offset + part['duration'][first]), u0 + 1)
+                pitches = [pitch_xml(x) for x in part['pitch'].tolist()]
+                edges = np.append(np.flatnonzero(first), len(part)).tolist()
+                chords = [pitches[a:b] for a, b in zip(edges[:-1], edges[1:])]
+
+                in_measure = np.searchsorted(measure, np.arange(count + 1)).tolist()
+                u0, u1 = u0.tolist(), u1.tolist()
+
+                out = []
+                for m in range(count):
+                    a, b = in_measure[m], in_measure[m+1]
+                    number = start + m + 1
+                    out.append(f'<measure number="{number}">\n')
+                    if number == 1:
+                        out.append(_attributes(layout, clefs[p], tempo if p == 0 else None))
+                    out.append(_measure_notes(u0[a:b], u1[a:b], chords[a:b], layout))
+                    out.append('</measure>\n')
+                parts[p].write(''.join(out).encode('utf-8'))
+
+        with open(filename, 'wb') as f:
+            part_list = ''.join(f'<score-part id="P{p}"><part-name>{escape(name)}</part-name></score-part>\n'
+                                for p, name in enumerate(part_names(names), start = 1))
+            f.write((HEADER + f'<work><work-title>{TITLE}</work-title></work>\n'
+                     f'<part-list>\n{part_list}</part-list>\n').encode('utf-8'))
+
+            for p, part in enumerate(parts, start = 1):
+                f.write(f'<part id="P{p}">\n'.encode('utf-8'))
+                part.seek(0)
+                shutil.copyfileobj(part, f)
+                f.write(b'</part>\n')
+
+            f.write(b'</score-partwise>\n')
+    finally:
+        for part in parts:
+            part.close()
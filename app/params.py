@@ -0,0 +1,210 @@
+from app.constraints import Constraints
+
+from dataclasses import dataclass, replace
+from functools import lru_cache
+
+@lru_cache(maxsize = 64)
+def _scale(edo_size, interval_struct, tonic):
+    # edopi pulls in matplotlib, so it is only imported when a scale is needed
+    from edopi import Scale
+    return Scale(edo_size, interval_struct, tonic)
+
+def _text(fields, name):
+    return str(fields.get(name, '')).strip()
+
+def _natural(fields, name, message, positive = True):
+    text = _text(fields, name)
+    if not text.isdecimal() or (positive and int(text) == 0):
+        raise ValueError(message)
+    return int(text)
+
+def _numbers(fields, name, kind, message):
+    try:
+        return tuple(kind(x) for x in _text(fields, name).split())
+    except ValueError:
+        raise ValueError(message) from None
+
+def _constraints(d, name):
+    if not d:
+        return None
+    try:
+        return Constraints.from_dict(d)
+    except (AttributeError, KeyError, TypeError, ValueError):
+        raise ValueError(f'As restrições de "{name}" são inválidas.') from None
+
+def _format(x):
+    return str(int(x)) if float(x).is_integer() else repr(x)
+
+@dataclass(frozen = True, slots = True)
+class Params:
+    """
+    The parameters of a composition, parsed and validated once from the fields
+    of the interface or of a parameter file.
+
+    Instances are immutable and hashable, so they can be shared between threads
+    and used as cache keys.
+
+    Attributes:
+        inst_names (tuple): Names of the instruments.
+        base_octaves (tuple): Base octave of each instrument.
+        inst_weights (tuple): Weight of each instrument, plus one for the silence.
+        edo_size (int): Size of the equal division of the octave.
+        interval_struct (tuple): Intervals of the scale, summing to `edo_size`.
+        tonic (int): The tonic of the scale.
+        k (int): Size of the modules.
+        l (int): Number of positions kept between consecutive modules.
+        measures (int): Number of measures.
+        beats (int): Number of beats per measure.
+        n_timepoints (tuple): Resolution of each beat, or a single one for every beat.
+        seed (int): Seed of the random choices, or None to draw a new one.
+        chord_constraints (Constraints): Optional constraints of the chord sequence.
+        rhythm_constraints (Constraints): Optional constraints of the rhythm sequence.
+    """
+
+    inst_names: tuple
+    base_octaves: tuple
+    inst_weights: tuple
+    edo_size: int
+    interval_struct: tuple
+    tonic: int
+    k: int
+    l: int
+    measures: int
+    beats: int
+    n_timepoints: tuple
+    seed: int = None
+    chord_constraints: Constraints = None
+    rhythm_constraints: Constraints = None
+
+    @classmethod
+    def from_fields(cls, fields):
+        """
+        Parses and validates parameter fields, reading each of them once.
+        Args:
+            fields (dict): The fields, as the interface saves them (see `main.generate_piece`).
+                           Values may be strings or numbers, except 'inst_names', a list of names;
+                           other keys are ignored.
+        Returns:
+            Params: The parameters.
+        Raises:
+            ValueError: With the message of the first invalid field.
+        """
+        if not isinstance(fields, dict):
+            raise ValueError("Os parâmetros devem associar cada campo ao seu valor.")
+
+        inst_names = fields.get('inst_names') or ()
+        if not isinstance(inst_names, (list, tuple)) or not all(isinstance(n, str) for n in inst_names):
+            raise ValueError("O campo \"inst_names\" deve ser uma lista de nomes de instrumentos.")
+        inst_names = tuple(inst_names)
+        if not inst_names:
+            raise ValueError("É necessário escolher ao menos um instrumento!")
+
+        base_octaves = _numbers(fields, 'base_octaves', int, "O campo \"Oitavas Base\" só admite valores numéricos.")
+        if len(base_octaves) != len(inst_names):
+            raise ValueError("O campo \"Oitavas Base\" deve conter um valor para cada instrumento escolhido.")
+        if any(o < 0 or o > 9 for o in base_octaves):
+            raise ValueError("Todos os valores no campo \"Oitavas Base\" devem estar entre 0 e 9.")
+
+        inst_weights = _numbers(fields, 'inst_weights', float, "O campo \"Probabilidades\" deve conter valores numéricos.")
+        if len(inst_weights) != len(inst_names) + 1:
+            raise ValueError("O campo \"Probabilidades\" deve conter um valor para cada instrumento escolhido, "
+                             "com um valor adicional para as alturas que não serão tocadas.")
+        if not all(w > 0 for w in inst_weights):
+            raise ValueError("O campo \"Probabilidades\" só admite números positivos.")
+
+        edo_size = _natural(fields, 'edo_size', "O campo \"Tamanho do EDO\" deve ser um inteiro positivo.")
+
+        struct = _text(fields, 'interval_struct').split()
+        if not all(i.isdecimal() and int(i) > 0 for i in struct):
+            raise ValueError("O campo \"Estrutura Intervalar\" só admite números positivos.")
+        interval_struct = tuple(int(i) for i in struct)
+        if sum(interval_struct) != edo_size:
+            raise ValueError("A estrutura intervalar deve somar o tamanho do EDO.")
+
+        tonic = _natural(fields, 'tonic', "O campo \"Tônica\" deve conter um número.", positive = False)
+        k = _natural(fields, 'k', "O campo \"k\" só admite números inteiros positivos.")
+        l = _natural(fields, 'l', "O campo \"l\" só admite números naturais menores que \"k\".", positive = False)
+        if l >= k:
+            raise ValueError("O campo \"l\" só admite números naturais menores que \"k\".")
+        measures = _natural(fields, 'measures', "O campo \"N° de módulos\" só admite números inteiros positivos.")
+        beats = _natural(fields, 'beats', "O campo \"Beats por módulo\" só admite números inteiros positivos.")
+
+        n_timepoints = _numbers(fields, 'n_timepoints', int, "O campo \"Resolução por beat\" só admite valores numéricos.")
+        if len(n_timepoints) == 1 and beats != 1:
+            if n_timepoints[0] < 1:
+                raise ValueError("O campo \"Resolução por módulo\" só admite números inteiros positivos.")
+        elif len(n_timepoints) == beats:
+            if any(n_tp < 1 for n_tp in n_timepoints):
+                raise ValueError("Todos os valores no campo \"Resolução por beat\" devem ser positivos.")
+        else:
+            raise ValueError("Cada beat deve ter um valor de resolução definido.")
+
+        seed = _text(fields, 'seed')
+        if seed and not seed.isdecimal():
+            raise ValueError("O campo \"Semente\" deve ficar vazio ou conter um número inteiro não negativo.")
+
+        constraints = fields.get('constraints') or {}
+        if not isinstance(constraints, dict):
+            raise ValueError("O campo \"constraints\" deve associar restrições a 'instruments' e 'timepoints'.")
+
+        return cls(inst_names, base_octaves, inst_weights, edo_size, interval_struct, tonic, k, l, measures, beats,
+                   n_timepoints, int(seed) if seed else None,
+                   _constraints(constraints.get('instruments'), 'instruments'),
+                   _constraints(constraints.get('timepoints'), 'timepoints'))
+
+    @classmethod
+    def coerce(cls, params):
+        """
+        Returns `params` if it already is a Params, or parses it as fields otherwise.
+        Raises:
+            ValueError: If the fields are invalid.
+        """
+        return params if isinstance(params, cls) else cls.from_fields(params)
+
+    def to_fields(self):
+        """
+        Returns the fields of the parameters, in the form the interface saves them.
+        `from_fields` gives back equal parameters.
+        """
+        fields = {'inst_names' : list(self.inst_names),
+                  'base_octaves' : ' '.join(map(str, self.base_octaves)),
+                  'inst_weights' : ' '.join(map(_format, self.inst_weights)),
+                  'edo_size' : str(self.edo_size),
+                  'interval_struct' : ' '.join(map(str, self.interval_struct)),
+                  'tonic' : str(self.tonic),
+                  'k' : str(self.k),
+                  'l' : str(self.l),
+                  'measures' : str(self.measures),
+                  'beats' : str(self.beats),
+                  'n_timepoints' : ' '.join(map(str, self.n_timepoints)),
+                  'seed' : '' if self.seed is None else str(self.seed)}
+
+        constraints = {name : c.to_dict() for name, c in (('instruments', self.chord_constraints),
+                                                           ('timepoints', self.rhythm_constraints)) if c is not None}
+        if constraints:
+            fields['constraints'] = constraints
+        return fields
+
+    def with_seed(self, seed):
+        """
+        Returns a copy of the parameters with the given seed.
+        """
+        return replace(self, seed = seed)
+
+    @property
+    def scale(self):
+        """
+        The `Scale` of the parameters, built once per distinct scale.
+        """
+        return _scale(self.edo_size, self.interval_struct, self.tonic)
+
+    @property
+    def base_pitches(self):
+        return [(x*self.edo_size) + self.tonic for x in self.base_octaves]
+
+    @property
+    def n_tps(self):
+        """
+        The number of timepoints per measure.
+        """
+        return self.beats*self.n_timepoints[0] if len(self.n_timepoints) == 1 else sum(self.n_timepoints)
@@ -0,0 +1,35 @@
+from functools import lru_cache
+
+import numpy as np
+
+@lru_cache(maxsize=256)
+def _pitch_table(system_size, interval_struct, tonic, base_pitch, size):
+    steps = np.concatenate(([0], np.cumsum(interval_struct)[:-1]))
+    scale_size = len(steps)
+
+    # last scale degree at or below the base pitch, counted from the tonic at octave 0
+    octave, rest = divmod(base_pitch - tonic, system_size)
+    first = octave * scale_size + np.searchsorted(steps, rest, side='right') - 1
+
+    degrees = first + np.arange(size)
+    pitches = tonic + (degrees // scale_size) * system_size + steps[degrees % scale_size]
+
+    table = pitches * (12 / system_size)
+    table.setflags(write=False)
+    return table
+
+def pitch_table(scale, base_pitch, size):
+    """
+    Returns the MIDI pitch of the first `size` scale degrees starting at `base_pitch`.
+    Entry i is the pitch i scale steps above `base_pitch` (or above the closest scale
+    pitch below it, if `base_pitch` is not in the scale), as a possibly microtonal
+    MIDI number. Tables are memoized across compositions, keeping the most recently
+    used ones.
+    Args:
+        scale (Scale): An edopi scale.
+        base_pitch (int): The starting pitch, in steps of the scale's EDO.
+        size (int): Number of degrees in the table.
+    Returns:
+        ndarray: Read-only float array of length `size`.
+    """
+    return _pitch_table(scale.system_size, tuple(scale.interval_struct), scale.tonic, base_pitch, size)
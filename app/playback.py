@@ -0,0 +1,197 @@
+import threading
+import time
+
+# longest stretch, in seconds, a part plays without checking whether it was stopped
+CHECK_INTERVAL = 0.25
+
+def play_part_until(part_dict, stopped, tempo):
+    """
+    Plays the events of a part like `utils.play_part`, but stops as soon as
+    `stopped` is set, ending the notes that are still sounding.
+    Args:
+        part_dict (dict): The part instrument ('inst') and its (pitches, duration) events ('events').
+        stopped (Event): Set to stop playback.
+        tempo (int): The playback tempo, which turns CHECK_INTERVAL into beats.
+    """
+    from scamp import wait
+
+    check_beats = CHECK_INTERVAL * tempo / 60
+    inst = part_dict['inst']
+    for pitch, dur in part_dict['events']:
+        if pitch != 'R':
+            inst.play_chord(pitch, 1, dur, blocking = False)
+
+        remaining = dur
+        while remaining > 0 and not stopped.is_set():
+            step = min(remaining, check_beats)
+            wait(step)
+            remaining -= step
+
+        if stopped.is_set():
+            inst.end_all_notes()
+            return
+
+class PlaybackController:
+    """
+    Controls the playback of a composition: play a range of measures, pause,
+    resume, seek and stop.
+
+    Only the measures being played are compiled (or sliced from the compiled
+    table), so previewing a short excerpt of a long piece starts at once.
+
+    Attributes:
+        composition (Composition): The composition being played.
+        tempo (int): The playback tempo.
+        on_end (function): Called with no arguments when playback ends or is stopped.
+        state (str): 'stopped', 'playing' or 'paused'.
+    """
+
+    def __init__(self, composition, tempo = 100, on_end = None, pool = None):
+        """
+        Initializes the controller. No sound is made until `play` or `play_range`.
+
+        Args:
+            composition (Composition): The composition to play.
+            tempo (int): The playback tempo.
+            on_end (function): Optional callback for the end of playback.
+            pool (SessionPool): The pool to play on. Defaults to the shared pool.
+        """
+        self.composition = composition
+        self.tempo = tempo
+        self.on_end = on_end
+        self.state = 'stopped'
+
+        self._pool = pool
+        self._thread = None
+        self._stop = threading.Event()
+
+        self._range = (0, len(composition.chord_seq))
+        self._start_beat = 0
+        self._started_at = 0.0
+        self._paused_at = 0
+
+    @property
+    def position(self):
+        """
+        The current playback position, in beats from the start of the piece.
+        """
+        if self.state == 'playing':
+            elapsed = (time.monotonic() - self._started_at) * self.tempo / 60
+            return min(self._start_beat + elapsed, self._range[1] * self.composition.beats)
+        if self.state == 'paused':
+            return self._paused_at
+        return self._range[0] * self.composition.beats
+
+    def play(self):
+        """
+        Plays the whole piece.
+        """
+        self.play_range(0)
+
+    def play_range(self, start_measure, end_measure = None):
+        """
+        Plays measures start_measure to end_measure-1, interrupting any current playback.
+
+        Args:
+            start_measure (int): First measure (starting at 0).
+            end_measure (int): Measure after the last one. Defaults to the end of the piece.
+        """
+        n_measures = len(self.composition.chord_seq)
+        end_measure = n_measures if end_measure is None else min(end_measure, n_measures)
+
+        self._range = (start_measure, end_measure)
+        self._play_from(start_measure * self.composition.beats)
+
+    def seek(self, measure):
+        """
+        Continues playback (or the paused position) from the given measure, keeping
+        the end of the current range.
+        """
+        if self.state == 'paused':
+            self._paused_at = measure * self.composition.beats
+        else:
+            self._play_from(measure * self.composition.beats)
+
+    def pause(self):
+        """
+        Pauses playback, keeping the current position.
+        """
+        if self.state == 'playing':
+            position = self.position
+            self.state = 'paused'
+            self._halt()
+            self._paused_at = position
+
+    def resume(self):
+        """
+        Resumes a paused playback from where it stopped.
+        """
+        if self.state == 'paused':
+            self._play_from(self._paused_at)
+
+    def stop(self):
+        """
+        Stops playback and calls `on_end`.
+        """
+        if self.state != 'stopped':
+            self.state = 'stopped'
+            self._halt()
+            if self.on_end is not None:
+                self.on_end()
+
+    def _halt(self):
+        self._stop.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            # the parts check `stopped` every CHECK_INTERVAL seconds, which bounds the wait
+            self._thread.join()
+        self._thread = None
+
+    def _play_from(self, beat):
+        """
+        Starts playing the current range from the given beat in a background thread.
+        """
+        self._halt()
+
+        composition = self.composition
+        grid = composition.grid
+        first, end = int(beat // composition.beats), self._range[1]
+
+        # events from the measure containing `beat`, skipping the notes attacked before it
+        events = composition.events_in_range(first, end)
+        skip = round((beat - first * composition.beats) * grid.ticks_per_beat)
+        events = events[events['onset'] >= skip]
+        events['onset'] -= skip
+        length = (end - first) * grid.measure_ticks - skip
+
+        parts = {p : composition.part_events(p, events, length) for p in range(1, len(composition.inst_names)+1)}
+
+        self._stop = threading.Event()
+        self._start_beat = beat
+        self._started_at = time.monotonic()
+        self.state = 'playing'
+
+        self._thread = threading.Thread(target = self._run, args = (parts, self._stop), daemon = True)
+        self._thread.start()
+
+    def _run(self, parts, stopped):
+        if self._pool is None:
+            from app.session import get_pool
+            self._pool = get_pool()
+
+        session = self._pool.session(self.tempo)
+        insts = self._pool.parts(self.composition.inst_names)
+
+        try:
+            for p, events in parts.items():
+                session.fork(play_part_until, args = ({'inst' : insts[p], 'events' : events}, stopped, self.tempo))
+            session.wait_for_children_to_finish()
+        finally:
+            # a newer playback owns the pool once `_stop` has been replaced
+            if stopped is self._stop:
+                self._pool.reset()
+
+        # reached the end of the range without being interrupted
+        if not stopped.is_set():
+            self.state = 'stopped'
+            if self.on_end is not None:
+                self.on_end()
@@ -0,0 +1,70 @@
+from app.utils import cache_dir, save_json, load_json
+
+import os
+import sys
+
+def scamp_settings_file():
+    """
+    Returns the path of SCAMP's playback settings file, found the way SCAMP
+    finds its data folder, without importing it.
+    """
+    if sys.platform.startswith('win'):
+        data_path = os.getenv('LOCALAPPDATA', '')
+    elif sys.platform.startswith('darwin'):
+        data_path = '~/Library/Application Support'
+    else:
+        data_path = os.getenv('XDG_DATA_HOME', '~/.local/share')
+    return os.path.join(os.path.expanduser(data_path), 'SCAMP', 'playbackSettings.json')
+
+def configured_soundfont():
+    """
+    Returns the default soundfont configured in SCAMP's playback settings, as
+    written there (a name or a path), or None if the settings cannot be read.
+    """
+    try:
+        return load_json(scamp_settings_file()).get('default_soundfont')
+    except (OSError, ValueError, AttributeError):
+        return None
+
+def read_soundfont_presets():
+    """
+    Reads the preset names of SCAMP's default soundfont.
+    Returns:
+        tuple: The soundfont path and the sorted list of preset names.
+    """
+    from scamp import playback_settings
+    from scamp._soundfont_host import get_soundfont_presets, resolve_soundfont
+
+    soundfont = resolve_soundfont(playback_settings.default_soundfont)
+    return soundfont, sorted([p.name for p in get_soundfont_presets()])
+
+def load_presets(refresh = False):
+    """
+    Returns the preset names of the default soundfont, from an on-disk cache
+    when neither the configured soundfont nor its file have changed since it was read.
+    Reading the cache does not import SCAMP, which keeps startup fast.
+    Args:
+        refresh (bool): Whether to ignore the cache and read the soundfont again.
+    Returns:
+        list: The sorted preset names.
+    """
+    filename = os.path.join(cache_dir(), 'presets.json')
+    configured = configured_soundfont()
+
+    if not refresh:
+        try:
+            cached = load_json(filename)
+            if (cached['configured'] == configured and
+                os.path.getmtime(cached['soundfont']) == cached['mtime']):
+                return cached['presets']
+        except (OSError, ValueError, KeyError):
+            pass
+
+    soundfont, presets = read_soundfont_presets()
+    try:
+        save_json(filename, {'configured' : configured, 'soundfont' : soundfont,
+                             'mtime' : os.path.getmtime(soundfont), 'presets' : presets})
+    except OSError:
+        pass
+
+    return presets
@@ -0,0 +1,127 @@
+from contextlib import contextmanager
+
+import logging
+import os
+import sys
+import time
+
+log = logging.getLogger(__name__)
+
+# environment variables read by `capture_from_env`, so the GUI can be profiled too
+CAPTURE_ENV = 'GFT_CAPTURE'
+CAPTURE_OUT_ENV = 'GFT_CAPTURE_OUT'
+
+class Stages:
+    """
+    Wall-clock timers and counters of the stages a composition goes through
+    (parsing, generation, event compilation, score building, file output).
+
+    Timing a stage costs two clock reads, so the timers are always on.
+
+    Attributes:
+        timings (dict): Total seconds spent in each stage.
+        calls (dict): Number of times each stage ran.
+        counters (dict): Named counts (measures, events, notes...).
+    """
+
+    def __init__(self):
+        self.timings = {}
+        self.calls = {}
+        self.counters = {}
+
+    @contextmanager
+    def stage(self, name):
+        """
+        Times the enclosed block as one run of the stage `name`.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] = self.timings.get(name, 0.0) + time.perf_counter() - start
+            self.calls[name] = self.calls.get(name, 0) + 1
+
+    def count(self, name, n = 1):
+        """
+        Adds n to the counter `name`.
+        """
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def as_dict(self):
+        """
+        Returns the timings, calls and counters as plain dictionaries.
+        """
+        return {'timings' : dict(self.timings), 'calls' : dict(self.calls), 'counters' : dict(self.counters)}
+
+    def __str__(self):
+        stages = ', '.join(f'{name} {secs*1000:.1f} ms' for name, secs in self.timings.items())
+        counters = ', '.join(f'{name} {n}' for name, n in self.counters.items())
+        return '; '.join(part for part in (stages, counters) if part)
+
+def configure_logging(verbosity = 0):
+    """
+    Sends the program's log records to stderr.
+    Without this call only warnings and errors are shown, and disabled debug
+    calls cost a single level check.
+    Args:
+        verbosity (int): 0 for warnings, 1 for stage summaries, 2 for debug records.
+    """
+    level = {0 : logging.WARNING, 1 : logging.INFO}.get(verbosity, logging.DEBUG)
+    logging.basicConfig(level = level, format = '%(asctime)s %(name)s %(levelname)s: %(message)s')
+    logging.getLogger('app').setLevel(level)
+
+@contextmanager
+def capture(kind = None, filename = None):
+    """
+    Profiles the enclosed block.
+    Args:
+        kind (str): None (no profiling), 'cprofile' or 'tracemalloc'.
+        filename (str): Where to dump the cProfile stats or the tracemalloc snapshot.
+                        If not given, a summary of the top entries goes to stderr.
+    Raises:
+        ValueError: If `kind` is unknown.
+    """
+    if not kind:
+        yield
+        return
+
+    if kind == 'cprofile':
+        import cProfile
+        import pstats
+
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            if filename:
+                profiler.dump_stats(filename)
+            else:
+                pstats.Stats(profiler, stream = sys.stderr).sort_stats('cumulative').print_stats(25)
+
+    elif kind == 'tracemalloc':
+        import tracemalloc
+
+        tracemalloc.start(25)
+        try:
+            yield
+        finally:
+            snapshot = tracemalloc.take_snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            if filename:
+                snapshot.dump(filename)
+            else:
+                print(f'tracemalloc: atual {current/1024:.0f} KiB, pico {peak/1024:.0f} KiB', file = sys.stderr)
+                for stat in snapshot.statistics('lineno')[:25]:
+                    print(stat, file = sys.stderr)
+
+    else:
+        raise ValueError(f'Tipo de perfil desconhecido: "{kind}".')
+
+def capture_from_env():
+    """
+    Returns a `capture` configured by the GFT_CAPTURE and GFT_CAPTURE_OUT variables.
+    """
+    return capture(os.environ.get(CAPTURE_ENV), os.environ.get(CAPTURE_OUT_ENV))
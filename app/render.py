@@ -0,0 +1,185 @@
+from app.midi import BEND_CENTER, part_bends, note_and_bend
+
+from concurrent.futures import ProcessPoolExecutor
+
+import os
+import re
+import tempfile
+import wave
+import numpy as np
+
+SAMPLE_RATE = 44100
+
+# the gain of the synth SCAMP creates for playback
+GAIN = 0.2
+
+# seconds rendered after the last measure, so the last notes can ring out
+TAIL = 2.0
+
+# largest number of frames synthesized in one call
+BLOCK_FRAMES = 65536
+
+# measures compiled at a time; memory use is bounded by this, not by the piece length
+CHUNK = 4096
+
+def load_synth(samplerate = SAMPLE_RATE):
+    """
+    Creates a FluidSynth synthesizer with SCAMP's default soundfont loaded, using
+    the same bindings as SCAMP. No audio driver is started, so it also works on
+    machines without an audio device.
+    Args:
+        samplerate (int): The sample rate.
+    Returns:
+        tuple: The synthesizer and the id of the loaded soundfont.
+    Raises:
+        ModuleNotFoundError: If FluidSynth is not installed.
+    """
+    from scamp import playback_settings
+    from scamp._dependencies import fluidsynth
+    from scamp._soundfont_host import resolve_soundfont
+
+    if fluidsynth is None:
+        raise ModuleNotFoundError('O FluidSynth não está instalado; a renderização de áudio precisa dele.')
+
+    synth = fluidsynth.Synth(gain = GAIN, samplerate = float(samplerate))
+    sfid = synth.sfload(resolve_soundfont(playback_settings.default_soundfont))
+    return synth, sfid
+
+def render_wav(composition, filename, tempo = 100, parts = None, samplerate = SAMPLE_RATE, chunk = CHUNK):
+    """
+    Synthesizes the compiled events of a composition to a WAV file, as fast as
+    the CPU allows, with the soundfont presets SCAMP picks for the instrument
+    names. Samples are written as they are synthesized, between event times.
+    Args:
+        composition (Composition): The composition to render.
+        filename (str): The name of the '.wav' file.
+        tempo (int): The tempo, in beats per minute.
+        parts (list): Indices (starting at 1) of the parts to render. All of them if not given.
+        samplerate (int): The sample rate.
+        chunk (int): Number of measures compiled at a time.
+    Raises:
+        ModuleNotFoundError: If FluidSynth is not installed.
+    """
+    from scamp import playback_settings
+    from scamp._soundfont_host import get_best_preset_match_for_name
+
+    names = composition.inst_names
+    parts = list(range(1, len(names) + 1)) if parts is None else list(parts)
+    velocity = int(playback_settings.soundfont_volume_to_velocity_curve.value_at(1))
+
+    synth, sfid = load_synth(samplerate)
+    try:
+        # one synth channel per (part, bend), each with the preset of its part
+        all_bends = part_bends(composition)
+        bends, channels, used = {}, {}, 0
+        for p in parts:
+            preset = get_best_preset_match_for_name(names[p-1])[0]
+            bends[p] = all_bends[p-1]
+            channels[p] = np.arange(used, used + len(bends[p]))
+            used += len(bends[p])
+            for bend, channel in zip(bends[p].tolist(), channels[p].tolist()):
+                synth.program_select(channel, sfid, preset.bank, preset.preset)
+                if bend != BEND_CENTER:
+                    synth.pitch_bend(channel, bend - BEND_CENTER)
+
+        grid = composition.grid
+        to_frames = lambda ticks: ticks * 60 * samplerate // (grid.ticks_per_beat * tempo)
+        measures = len(composition.chord_seq)
+
+        with wave.open(filename, 'wb') as out:
+            out.setnchannels(2)
+            out.setsampwidth(2)
+            out.setframerate(samplerate)
+
+            def advance(frames):
+                while frames > 0:
+                    n = min(frames, BLOCK_FRAMES)
+                    out.writeframes(np.asarray(synth.get_samples(n), dtype = np.int16).tobytes())
+                    frames -= n
+
+            now = 0
+            for start in range(0, measures, chunk):
+                events = composition.events_in_range(start, start + chunk)
+                events = events[np.isin(events['part'], parts)]
+                if len(events) == 0:
+                    continue
+
+                onset = events['onset'] + np.int64(start) * grid.measure_ticks
+                note, bend = note_and_bend(events['pitch'])
+                channel = np.empty(len(events), dtype = np.int64)
+                for p in parts:
+                    mine = events['part'] == p
+                    channel[mine] = channels[p][np.searchsorted(bends[p], bend[mine])]
+
+                # note-offs come before note-ons at the same frame, so repeated notes are not cut
+                times = np.concatenate((to_frames(onset + events['duration']), to_frames(onset)))
+                kinds = np.repeat([0, 1], len(events))
+                notes = np.concatenate((note, note))
+                chans = np.concatenate((channel, channel))
+                order = np.lexsort((notes, kinds, times))
+
+                for t, kind, c, n in zip(times[order].tolist(), kinds[order].tolist(),
+                                         chans[order].tolist(), notes[order].tolist()):
+                    if t > now:
+                        advance(t - now)
+                        now = t
+                    if kind:
+                        synth.noteon(c, n, velocity)
+                    else:
+                        synth.noteoff(c, n)
+
+            advance(to_frames(np.int64(measures) * grid.measure_ticks) + int(TAIL * samplerate) - now)
+    finally:
+        synth.delete()
+
+def stem_filenames(composition, stem):
+    """
+    Builds the names of the per-instrument stems of a render.
+    Args:
+        composition (Composition): The composition.
+        stem (str): The base filename, without extension.
+    Returns:
+        list: One '.wav' filename per part, numbered and named after its instrument.
+    """
+    return [f"{stem}_{p}_{re.sub(r'[^A-Za-z0-9]+', '_', name).strip('_')}.wav"
+            for p, name in enumerate(composition.inst_names, start = 1)]
+
+def _render_stem(task):
+    from app.composition import Composition
+
+    saved, filename, tempo, part, samplerate = task
+    render_wav(Composition.load(saved), filename, tempo, [part], samplerate)
+    return filename
+
+def render_stems(composition, stem, tempo = 100, workers = None, samplerate = SAMPLE_RATE):
+    """
+    Renders one WAV file per instrument, in parallel worker processes.
+    The workers read the composition from a temporary binary file (see `storage`).
+    Args:
+        composition (Composition): The composition to render.
+        stem (str): The base filename of the stems, without extension.
+        tempo (int): The tempo, in beats per minute.
+        workers (int): Number of processes. Defaults to the number of CPUs; with 1,
+                       the stems are rendered in this process.
+        samplerate (int): The sample rate.
+    Returns:
+        list: The filenames of the stems.
+    Raises:
+        ModuleNotFoundError: If FluidSynth is not installed.
+    """
+    filenames = stem_filenames(composition, stem)
+    workers = min(workers or os.cpu_count() or 1, len(filenames))
+
+    if workers == 1:
+        for p, filename in enumerate(filenames, start = 1):
+            render_wav(composition, filename, tempo, [p], samplerate)
+        return filenames
+
+    with tempfile.TemporaryDirectory() as directory:
+        saved = os.path.join(directory, 'composition.gft')
+        composition.save(saved)
+        tasks = [(saved, filename, tempo, p, samplerate) for p, filename in enumerate(filenames, start = 1)]
+        with ProcessPoolExecutor(workers) as executor:
+            list(executor.map(_render_stem, tasks))
+
+    return filenames
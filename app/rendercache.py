@@ -0,0 +1,190 @@
+from app.utils import cache_dir
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import numpy as np
+
+# bumped whenever the rendered artifacts change, so older entries are never served
+RENDER_VERSION = 3
+
+# default size limit of the cache, in bytes
+MAX_BYTES = 512 * 1024 * 1024
+
+def render_key(composition, **options):
+    """
+    Hashes everything a rendered export depends on: the sequences, the duration
+    choices, the parameters and the export options.
+    Args:
+        composition (Composition): The composition being exported.
+        **options: Export options (e.g. tempo).
+    Returns:
+        str: A hexadecimal digest identifying the rendered artifacts.
+    """
+    h = hashlib.blake2b(digest_size = 20)
+
+    for seq in (composition.chord_seq, composition.rhythm_seq, composition.dur_seq):
+        arr = np.ascontiguousarray(seq, dtype = np.int64)
+        h.update(repr(arr.shape).encode())
+        h.update(arr.tobytes())
+
+    scale = composition.scale
+    meta = {'version' : RENDER_VERSION,
+            'scale' : [scale.system_size, list(scale.interval_struct), scale.tonic],
+            'beats' : composition.beats,
+            'n_timepoints' : composition.n_timepoints,
+            'base_pitches' : list(composition.base_pitches),
+            'inst_names' : list(composition.inst_names),
+            'pars' : composition.pars,
+            'options' : options}
+    h.update(json.dumps(meta, sort_keys = True, default = str).encode())
+
+    return h.hexdigest()
+
+class RenderCache:
+    """
+    On-disk cache of rendered exports, addressed by `render_key`.
+
+    Every artifact is a file named after its key and extension. Reading an entry
+    refreshes its modification time, and storing one evicts the least recently
+    used files until the cache fits in `max_bytes`.
+
+    Attributes:
+        directory (str): Directory of the cached files.
+        max_bytes (int): Size limit of the cache.
+    """
+
+    def __init__(self, directory = None, max_bytes = MAX_BYTES):
+        """
+        Initializes the cache.
+
+        Args:
+            directory (str): Directory of the cached files. Defaults to the user cache directory.
+            max_bytes (int): Size limit of the cache.
+        """
+        self.directory = cache_dir('renders') if directory is None else directory
+        self.max_bytes = max_bytes
+        os.makedirs(self.directory, exist_ok = True)
+
+    def path(self, key, ext):
+        """
+        Returns the path of the cached artifact with the given key and extension.
+        """
+        return os.path.join(self.directory, key + ext)
+
+    def fetch(self, key, ext, filename):
+        """
+        Copies a cached artifact to `filename`.
+
+        Args:
+            key (str): The render key.
+            ext (str): The artifact extension (e.g. '.xml').
+            filename (str): Destination of the copy.
+        Returns:
+            bool: Whether the artifact was in the cache.
+        """
+        cached = self.path(key, ext)
+        try:
+            shutil.copyfile(cached, filename)
+            os.utime(cached)
+        except FileNotFoundError:
+            return False
+        return True
+
+    def store(self, key, ext, filename):
+        """
+        Adds a copy of a rendered artifact to the cache, then evicts old entries.
+        Artifacts larger than the whole cache are not stored.
+
+        Args:
+            key (str): The render key.
+            ext (str): The artifact extension.
+            filename (str): The rendered file.
+        """
+        if os.path.getsize(filename) > self.max_bytes:
+            return
+
+        # copied under a temporary name first, so readers never see a partial file
+        fd, tmp = tempfile.mkstemp(dir = self.directory, suffix = '.tmp')
+        os.close(fd)
+        try:
+            shutil.copyfile(filename, tmp)
+            os.replace(tmp, self.path(key, ext))
+        except OSError:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+
+        self.evict()
+
+    def evict(self):
+        """
+        Removes the least recently used files until the cache fits in `max_bytes`.
+        """
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and not entry.name.endswith('.tmp'):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def size(self):
+        """
+        Returns the total size of the cached files, in bytes.
+        """
+        return sum(e.stat().st_size for e in os.scandir(self.directory) if e.is_file())
+
+    def clear(self):
+        """
+        Removes every cached file.
+        """
+        for entry in os.scandir(self.directory):
+            if entry.is_file():
+                os.remove(entry.path)
+
+def cached_render(cache, key, ext, filename, render):
+    """
+    Produces `filename` from the cache, or renders it with `render` and caches the result.
+    Args:
+        cache (RenderCache): The cache, or None to always render.
+        key (str): The render key.
+        ext (str): The artifact extension.
+        filename (str): The file to produce.
+        render (function): Called with `filename` to render the artifact.
+    Returns:
+        bool: Whether the artifact came from the cache.
+    """
+    if cache is not None and cache.fetch(key, ext, filename):
+        return True
+
+    render(filename)
+    if cache is not None:
+        try:
+            cache.store(key, ext, filename)
+        except OSError:
+            pass
+    return False
+
+_cache = None
+
+def get_render_cache():
+    """
+    Returns the render cache shared by the GUI and the command line.
+    Returns:
+        RenderCache: The shared cache, in the user cache directory.
+    """
+    global _cache
+    if _cache is None:
+        _cache = RenderCache()
+    return _cache
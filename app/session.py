@@ -0,0 +1,118 @@
+import atexit
+import threading
+
+class SessionPool:
+    """
+    Keeps one warm SCAMP Session and its instrument parts between playbacks.
+
+    Creating a Session starts a few hundred clock threads and creating a part
+    loads its soundfont preset, so both are done once and reused: parts are
+    keyed by preset name and shared by every composition that uses it.
+
+    Attributes:
+        silent (bool): If True, parts make no sound (used for soak tests and headless runs).
+    """
+
+    def __init__(self, silent = False):
+        """
+        Initializes the pool. The session is only created when first needed.
+
+        Args:
+            silent (bool): Whether to create silent parts instead of soundfont parts.
+        """
+        self.silent = silent
+        self._session = None
+        self._parts = {}
+        self._lock = threading.Lock()
+
+    @property
+    def alive(self):
+        """
+        Whether the pool currently holds a session.
+        """
+        return self._session is not None
+
+    def session(self, tempo = 100):
+        """
+        Returns the pooled session, creating it on first use, set to the given tempo.
+
+        Args:
+            tempo (int): The playback tempo.
+        Returns:
+            Session: The pooled session.
+        """
+        with self._lock:
+            if self._session is None:
+                from scamp import Session
+                self._session = Session(tempo = tempo)
+            else:
+                self._session.tempo = tempo
+            return self._session
+
+    def part(self, name):
+        """
+        Returns the part for the given preset name, creating it on first use.
+
+        Args:
+            name (str): The preset name.
+        Returns:
+            ScampInstrument: The pooled part.
+        """
+        session = self._session if self._session is not None else self.session()
+        with self._lock:
+            if name not in self._parts:
+                self._parts[name] = session.new_silent_part(name) if self.silent else session.new_part(name)
+            return self._parts[name]
+
+    def parts(self, names):
+        """
+        Returns the parts of a composition, numbered from 1 like its instruments.
+
+        Args:
+            names (list): The preset names of the instruments.
+        Returns:
+            dict: The pooled part of each instrument.
+        """
+        return {p : self.part(nm) for p, nm in enumerate(names, start=1)}
+
+    def reset(self):
+        """
+        Stops whatever the session is playing and releases the per-note bookkeeping
+        it accumulated, keeping the session and the parts warm.
+        """
+        with self._lock:
+            if self._session is None:
+                return
+            for child in self._session.children():
+                child.kill()
+            for part in self._parts.values():
+                part.end_all_notes()
+            # the master clock keeps a time stamp for every note played
+            if not self._session.is_transcribing():
+                self._session.time_stamp_data.clear()
+
+    def close(self):
+        """
+        Stops the session and its clock threads and drops the parts.
+        The pool can still be used afterwards: a new session is created on demand.
+        """
+        self.reset()
+        with self._lock:
+            if self._session is not None:
+                self._session.kill()
+            self._session = None
+            self._parts = {}
+
+_pool = None
+
+def get_pool():
+    """
+    Returns the pool shared by every playback in the program, closed at exit.
+    Returns:
+        SessionPool: The shared pool.
+    """
+    global _pool
+    if _pool is None:
+        _pool = SessionPool()
+        atexit.register(_pool.close)
+    return _pool
@@ -0,0 +1,151 @@
+import json
+import struct
+import numpy as np
+
+# file layout: MAGIC, format version (uint16), header length (uint32), JSON header,
+# then the raw arrays, each starting at a multiple of ALIGNMENT
+MAGIC = b'GFTC'
+VERSION = 1
+PREFIX = struct.Struct('<4sHI')
+ALIGNMENT = 64
+
+EXTENSION = '.gft'
+
+def _aligned(offset):
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+def _sequence_array(seq):
+    """
+    Converts a chord, rhythm or duration sequence into the narrowest little-endian unsigned array.
+    """
+    arr = np.asarray(seq)
+    dtype = np.min_scalar_type(int(arr.max()) if arr.size else 0)
+    return np.ascontiguousarray(arr, dtype = dtype.newbyteorder('<'))
+
+def save_composition(composition, filename):
+    """
+    Saves a composition in the binary format: a small JSON header with the
+    parameters, followed by the chord and rhythm sequences as fixed-width
+    integer arrays, the duration choices and the compiled event table.
+    Args:
+        composition (Composition): The composition to save.
+        filename (str): The name of the file.
+    """
+    arrays = {'chord_seq' : _sequence_array(composition.chord_seq),
+              'rhythm_seq' : _sequence_array(composition.rhythm_seq),
+              'dur_seq' : _sequence_array(composition.dur_seq),
+              'events' : np.ascontiguousarray(composition.events)}
+
+    header = {'scale' : {'system_size' : composition.scale.system_size,
+                         'interval_struct' : list(composition.scale.interval_struct),
+                         'tonic' : composition.scale.tonic,
+                         'name' : composition.scale.name},
+              'beats' : composition.beats,
+              'n_timepoints' : composition.n_timepoints,
+              'base_pitches' : list(composition.base_pitches),
+              'inst_names' : list(composition.inst_names),
+              'inst_weights' : list(composition.inst_weights),
+              'name' : composition.name,
+              'pars' : composition.pars,
+              'seed' : composition.seed,
+              'arrays' : {}}
+
+    # the offsets depend on the header length, so the header is sized with placeholders first
+    for key, arr in arrays.items():
+        header['arrays'][key] = {'dtype' : np.lib.format.dtype_to_descr(arr.dtype), 'shape' : list(arr.shape), 'offset' : 0}
+    size = len(json.dumps(header).encode('utf-8')) + 32 * len(arrays)
+
+    offset = _aligned(PREFIX.size + size)
+    for key, arr in arrays.items():
+        header['arrays'][key]['offset'] = offset
+        offset = _aligned(offset + arr.nbytes)
+
+    encoded = json.dumps(header).encode('utf-8').ljust(size)
+
+    with open(filename, 'wb') as f:
+        f.write(PREFIX.pack(MAGIC, VERSION, size))
+        f.write(encoded)
+        for key, arr in arrays.items():
+            f.seek(header['arrays'][key]['offset'])
+            f.write(arr.tobytes())
+        f.truncate(offset)
+
+def read_header(filename):
+    """
+    Reads the JSON header of a file in the binary format.
+    Args:
+        filename (str): The name of the file.
+    Returns:
+        dict: The header, with the parameters and the layout of the arrays.
+    Raises:
+        ValueError: If the file is not in the binary format.
+    """
+    with open(filename, 'rb') as f:
+        prefix = f.read(PREFIX.size)
+        if len(prefix) < PREFIX.size:
+            raise ValueError(f'"{filename}" não é um arquivo de composição.')
+        magic, version, size = PREFIX.unpack(prefix)
+        if magic != MAGIC:
+            raise ValueError(f'"{filename}" não é um arquivo de composição.')
+        if version > VERSION:
+            raise ValueError(f'"{filename}" foi salvo por uma versão mais nova do programa.')
+        return json.loads(f.read(size))
+
+def load_arrays(filename, header = None, mmap = True):
+    """
+    Reads the arrays of a file in the binary format.
+    Args:
+        filename (str): The name of the file.
+        header (dict): The header, if already read.
+        mmap (bool): If True, the arrays are read-only memory maps of the file,
+                     so only the parts that are used are ever read from disk.
+    Returns:
+        dict: The 'chord_seq', 'rhythm_seq', 'dur_seq' and 'events' arrays.
+    """
+    header = read_header(filename) if header is None else header
+    arrays = {}
+
+    for key, layout in header['arrays'].items():
+        dtype = np.lib.format.descr_to_dtype(layout['dtype'])
+        shape = tuple(layout['shape'])
+        if mmap and np.prod(shape) > 0:
+            arrays[key] = np.memmap(filename, dtype = dtype, mode = 'r', offset = layout['offset'], shape = shape)
+        else:
+            with open(filename, 'rb') as f:
+                f.seek(layout['offset'])
+                arrays[key] = np.fromfile(f, dtype = dtype, count = int(np.prod(shape))).reshape(shape)
+                arrays[key].setflags(write = False)
+
+    return arrays
+
+def load_composition(cls, filename, mmap = True):
+    """
+    Rebuilds a composition saved by `save_composition`, with its event table.
+    Args:
+        cls (type): The Composition class.
+        filename (str): The name of the file.
+        mmap (bool): Whether to memory map the arrays instead of reading them.
+    Returns:
+        Composition: The composition, with `chord_seq` and `rhythm_seq` as integer arrays.
+    """
+    # edopi pulls in matplotlib, so it is only imported when a composition is loaded
+    from edopi import Scale
+
+    header = read_header(filename)
+    arrays = load_arrays(filename, header, mmap)
+    scale = header['scale']
+
+    composition = cls(arrays['chord_seq'],
+                      arrays['rhythm_seq'],
+                      scale = Scale(scale['system_size'], tuple(scale['interval_struct']), scale['tonic'], name = scale['name']),
+                      beats = header['beats'],
+                      n_timepoints = header['n_timepoints'],
+                      base_pitches = header['base_pitches'],
+                      inst_names = header['inst_names'],
+                      inst_weights = header['inst_weights'],
+                      name = header['name'],
+                      pars = header['pars'],
+                      seed = header.get('seed'),
+                      dur_seq = arrays.get('dur_seq'))
+    composition._events = arrays['events']
+    return composition
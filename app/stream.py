@@ -0,0 +1,137 @@
+from app.composition import Composition, draw_durations
+from app.engine import iter_sequence, new_seed
+from app.timegrid import time_grid
+from app.utils import play_part
+from app.session import get_pool
+
+from queue import Queue, Empty, Full
+
+import threading
+import numpy as np
+
+def stream_measures(params, measures = None, rng = None):
+    """
+    Yields the (voicing, rhythm) pair of each measure as it is generated.
+    Args:
+        params (Params): The parameters.
+        measures (int): Number of measures. Endless if not given.
+        rng (Generator): Optional NumPy random generator.
+    Yields:
+        tuple: The chord and rhythm nodes of the next measure.
+    """
+    n_insts = len(params.inst_names) + 1
+    chords = iter_sequence(n_insts, params.k, params.l, params.inst_weights, measures, rng,
+                           constraints = params.chord_constraints)
+    rhythms = iter_sequence(params.n_tps, params.k, params.l, None, measures, rng,
+                            constraints = params.rhythm_constraints)
+    return zip(chords, rhythms)
+
+class StreamPlayer:
+    """
+    Plays a piece while it is being generated.
+
+    A producer thread generates measures into a bounded queue and the player
+    compiles and plays them one at a time, so playback starts after the first
+    measure and memory stays constant even for an endless walk.
+
+    Attributes:
+        params (Params): Parameters of the piece.
+        tempo (int): The playback tempo.
+        measures (int): Number of measures to play. Endless if None.
+        seed (int): Seed of the random choices, drawn if `params.seed` is None.
+        rng (Generator): Generator of the sequences and of the durations, seeded with `seed`.
+        queue (Queue): Measures generated but not yet played.
+        played (int): Number of measures played so far.
+    """
+
+    def __init__(self, params, tempo = 100, measures = None, buffer_size = 8, rng = None, pool = None):
+        """
+        Initializes the player.
+
+        Args:
+            params (Params): The parameters.
+            tempo (int): The playback tempo.
+            measures (int): Number of measures to play. Endless if not given.
+            buffer_size (int): Maximum number of measures generated ahead of playback.
+            rng (Generator): Optional NumPy random generator, used instead of one seeded with the seed
+                             of the parameters.
+            pool (SessionPool): The pool to play on. Defaults to the shared pool.
+        """
+        self.params = params
+        self.tempo = tempo
+        self.measures = measures
+        self.seed = new_seed() if params.seed is None else params.seed
+        self.rng = np.random.default_rng(self.seed) if rng is None else rng
+        self.pool = get_pool() if pool is None else pool
+
+        self.queue = Queue(maxsize = buffer_size)
+        self.played = 0
+        self._stop = threading.Event()
+
+    def produce(self):
+        """
+        Generates measures into the queue until the piece ends or the player stops.
+        A None item marks the end of the piece.
+        The durations of each measure are drawn here, right after its sequences,
+        so a seed always gives the same piece.
+        """
+        grid = time_grid(self.params.beats, self.params.n_timepoints)
+        for voicing, rhythm in stream_measures(self.params, self.measures, self.rng):
+            measure = (voicing, rhythm, draw_durations(grid, np.shape([voicing]), self.rng))
+            while not self._stop.is_set():
+                try:
+                    self.queue.put(measure, timeout = 0.1)
+                    break
+                except Full:
+                    pass
+            if self._stop.is_set():
+                return
+        self.queue.put(None)
+
+    def next_measure(self):
+        """
+        Returns the next generated measure as a one-measure Composition, or None
+        when the piece has ended or the player was stopped.
+        """
+        while not self._stop.is_set():
+            try:
+                measure = self.queue.get(timeout = 0.1)
+            except Empty:
+                continue
+            if measure is None:
+                return None
+            voicing, rhythm, durations = measure
+            return Composition.from_params(self.params, [voicing], [rhythm], seed = self.seed, dur_seq = durations)
+        return None
+
+    def play(self):
+        """
+        Starts the producer and plays the measures as they arrive. Blocks until
+        the piece ends or `stop` is called.
+        """
+        producer = threading.Thread(target = self.produce, daemon = True)
+        producer.start()
+
+        try:
+            s = self.pool.session(self.tempo)
+            insts = self.pool.parts(self.params.inst_names)
+
+            composition = self.next_measure()
+            while composition is not None:
+                # every part's events span the whole measure, so measures stay aligned
+                for p, inst in insts.items():
+                    s.fork(play_part, args=({'inst' : inst, 'events' : composition.part_events(p)},))
+                s.wait_for_children_to_finish()
+                self.pool.reset()
+
+                self.played += 1
+                composition = self.next_measure()
+        finally:
+            self._stop.set()
+            self.pool.reset()
+
+    def stop(self):
+        """
+        Stops generation and playback after the current measure.
+        """
+        self._stop.set()
@@ -0,0 +1,172 @@
+from app.engine import generate_sequences
+
+from concurrent.futures import ProcessPoolExecutor
+from itertools import product
+
+import csv
+import os
+import time
+import numpy as np
+
+def parse_range(spec):
+    """
+    Parses a range given on the command line.
+    Args:
+        spec (str): 'field=v1,v2,...' or, for integers, 'field=start..stop' (inclusive).
+    Returns:
+        tuple: The field name and the list of its values, as strings.
+    Raises:
+        ValueError: If the range is malformed.
+    """
+    field, sep, values = spec.partition('=')
+    if not sep or not field or not values:
+        raise ValueError(f'Intervalo inválido: "{spec}" (use campo=v1,v2 ou campo=início..fim).')
+
+    if '..' in values and ',' not in values:
+        start, stop = values.split('..')
+        return field, [str(v) for v in range(int(start), int(stop) + 1)]
+    return field, values.split(',')
+
+def expand_grid(base, ranges):
+    """
+    Builds the parameter fields of every point of a sweep.
+    Args:
+        base (dict): Parameter fields shared by every point.
+        ranges (dict): Values taken by each swept field.
+    Returns:
+        list: One fields dictionary per point of the Cartesian product of the ranges.
+    """
+    names = list(ranges)
+    return [dict(base, **dict(zip(names, values))) for values in product(*(ranges[n] for n in names))]
+
+def composition_metrics(chords, rhythms, n_parts, n_tps, beats):
+    """
+    Computes the metrics of a set of generated sequences with array operations
+    over all of them at once.
+    Args:
+        chords (ndarray): Chord sequences, shaped (count, measures, k); symbol
+                          n_parts+1 is the silence.
+        rhythms (ndarray): Rhythm sequences, with the same shape.
+        n_parts (int): Number of instruments.
+        n_tps (int): Number of timepoints per measure.
+        beats (int): Number of beats per measure.
+    Returns:
+        dict: The instrument usage histogram (share of the voices given to each
+              symbol), the mean and deviation of the Hamming distance between
+              consecutive modules, the sounding voices and attacks per measure,
+              the attacks per beat and the share of timepoints ever attacked.
+    """
+    count, measures, _ = chords.shape
+    metrics = {}
+
+    usage = np.bincount(chords.ravel(), minlength = n_parts + 2)[1:] / chords.size
+    for symbol, share in enumerate(usage[:n_parts], start = 1):
+        metrics[f'usage_{symbol}'] = share
+    metrics['usage_silence'] = usage[n_parts]
+
+    for name, seqs in (('chord', chords), ('rhythm', rhythms)):
+        if measures > 1:
+            distance = (seqs[:, 1:] != seqs[:, :-1]).sum(axis = -1)
+            metrics[f'{name}_hamming_mean'] = distance.mean()
+            metrics[f'{name}_hamming_std'] = distance.std()
+        else:
+            metrics[f'{name}_hamming_mean'] = metrics[f'{name}_hamming_std'] = 0.0
+
+    # timepoints attacked by at least one sounding voice, per sequence and measure
+    played = chords <= n_parts
+    seq, measure, _ = np.nonzero(played)
+    attacked = np.zeros((count, measures, n_tps), dtype = bool)
+    attacked[seq, measure, rhythms[played] - 1] = True
+    attacks = attacked.sum(axis = -1)
+
+    metrics['sounding_voices'] = played.sum(axis = -1).mean()
+    metrics['attacks_per_measure'] = attacks.mean()
+    metrics['attacks_per_beat'] = attacks.mean() / beats
+    metrics['timepoint_coverage'] = attacked.any(axis = 1).mean()
+
+    return {key : float(value) for key, value in metrics.items()}
+
+def sweep_point(task):
+    """
+    Generates the sequences of one point of a sweep and measures them.
+    Runs in a worker process.
+    Args:
+        task (tuple): Point index, parameter fields, number of sequences and sweep seed.
+    Returns:
+        dict: The metrics of the point, or its error message.
+    """
+    from app.params import Params
+
+    index, fields, count, seed = task
+    start = time.perf_counter()
+    try:
+        p = Params.from_fields(fields)
+
+        # every point has its own stream, so results do not depend on the scheduling
+        rng = np.random.default_rng([seed, index])
+        n_parts = len(p.inst_names)
+        chords = generate_sequences(n_parts + 1, p.k, p.l, p.measures, p.inst_weights, count, rng,
+                                    constraints = p.chord_constraints)
+        rhythms = generate_sequences(p.n_tps, p.k, p.l, p.measures, count = count, rng = rng,
+                                     constraints = p.rhythm_constraints)
+        row = composition_metrics(chords, rhythms, n_parts, p.n_tps, p.beats)
+    except ValueError as e:
+        row = {'error' : str(e)}
+
+    row['seconds'] = time.perf_counter() - start
+    return row
+
+def run_sweep(base, ranges, count = 16, seed = 0, workers = None, report = None):
+    """
+    Runs a parameter sweep across a process pool.
+    Args:
+        base (dict): Parameter fields shared by every point.
+        ranges (dict): Values taken by each swept field (see `expand_grid`).
+        count (int): Number of sequences generated per point.
+        seed (int): Seed of the sweep; each point draws from its own stream of it.
+        workers (int): Number of processes. Defaults to the number of CPUs; with 1,
+                       the points run in this process.
+        report (function): Optional callback, called with the number of points done.
+    Returns:
+        list: One row per point: the swept values followed by the metrics.
+    """
+    points = expand_grid(base, ranges)
+    tasks = [(i, fields, count, seed) for i, fields in enumerate(points)]
+    workers = workers or os.cpu_count() or 1
+
+    if workers == 1:
+        results = map(sweep_point, tasks)
+        executor = None
+    else:
+        # a few chunks per worker amortise the transfers while keeping the load balanced
+        executor = ProcessPoolExecutor(workers)
+        results = executor.map(sweep_point, tasks, chunksize = max(1, len(tasks) // (workers * 8)))
+
+    rows = []
+    try:
+        for fields, metrics in zip(points, results):
+            rows.append({**{name : fields[name] for name in ranges}, **metrics})
+            if report is not None:
+                report(len(rows))
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    return rows
+
+def write_table(rows, filename):
+    """
+    Writes the rows of a sweep as a single CSV table. Columns missing from a
+    row (e.g. the usage of an instrument another point does not have) are left empty.
+    Args:
+        rows (list): Rows returned by `run_sweep`.
+        filename (str): The name of the file.
+    """
+    columns = []
+    for row in rows:
+        columns += [key for key in row if key not in columns]
+
+    with open(filename, 'w', newline = '') as f:
+        writer = csv.DictWriter(f, fieldnames = columns)
+        writer.writeheader()
+        writer.writerows(rows)
@@ -0,0 +1,74 @@
+from fractions import Fraction
+from functools import lru_cache
+from math import lcm
+
+import numpy as np
+
+class TimeGrid:
+    """
+    Integer tick representation of the timepoints of a measure.
+
+    The tick resolution is the LCM of the per-beat resolutions times the number
+    of duration divisions, so every onset, every gap between onsets and every
+    duration a note can take is a whole number of ticks.
+
+    Attributes:
+        beats (int): Number of beats per measure.
+        n_timepoints (tuple): Resolution of every beat, or a single resolution for all beats.
+        dur_divisions (int): Number of equal parts a gap between onsets is divided into
+            when choosing a duration (the sum of `n_timepoints`).
+        ticks_per_beat (int): Number of ticks in a beat.
+        measure_ticks (int): Number of ticks in a measure.
+        onsets (ndarray): Onset, in ticks, of each timepoint; timepoint t is at onsets[t-1].
+        duration_units (ndarray): Multipliers 1..dur_divisions of the duration unit.
+    """
+
+    def __init__(self, beats, n_timepoints):
+        """
+        Builds the grid for the given measure shape.
+
+        Args:
+            beats (int): Number of beats per measure.
+            n_timepoints (tuple): Resolution of every beat, or a single resolution for all beats.
+        """
+        self.beats = beats
+        self.n_timepoints = tuple(n_timepoints)
+
+        resolutions = self.n_timepoints if len(self.n_timepoints) != 1 else self.n_timepoints * beats
+
+        self.dur_divisions = sum(self.n_timepoints)
+        self.ticks_per_beat = lcm(*resolutions) * self.dur_divisions
+        self.measure_ticks = beats * self.ticks_per_beat
+
+        lengths = np.repeat([self.ticks_per_beat // r for r in resolutions], resolutions)
+        self.onsets = np.concatenate(([0], np.cumsum(lengths)[:-1])).astype(np.int64)
+        self.duration_units = np.arange(1, self.dur_divisions + 1, dtype=np.int64)
+
+    def duration_unit(self, interval):
+        """
+        Returns the duration unit, in ticks, of a gap of `interval` ticks.
+        Durations available in that gap are the unit times `duration_units`.
+        """
+        return interval // self.dur_divisions
+
+    def to_beats(self, ticks):
+        """
+        Converts a tick count to an exact number of beats.
+        """
+        return Fraction(int(ticks), self.ticks_per_beat)
+
+@lru_cache(maxsize=64)
+def _time_grid(beats, n_timepoints):
+    return TimeGrid(beats, n_timepoints)
+
+def time_grid(beats, n_timepoints):
+    """
+    Returns the TimeGrid for the given measure shape, reusing cached grids.
+
+    Args:
+        beats (int): Number of beats per measure.
+        n_timepoints (list): Resolution of every beat, or a single resolution for all beats.
+    Returns:
+        TimeGrid: The shared grid for that shape.
+    """
+    return _time_grid(int(beats), tuple(int(x) for x in n_timepoints))
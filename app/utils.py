@@ -1,11 +1,14 @@
 import random as rd
-from scamp import wait
 import json
+import logging
+import os
+
+log = logging.getLogger(__name__)
 
 def save_json(filename, content, encoder = None):
-    dumped_content = json.dumps(content, cls = encoder)
+    # json.dump writes the encoded chunks as they are produced, without building the whole string
     json_file = open(filename, 'w')
-    json_file.write(dumped_content)
+    json.dump(content, json_file, cls = encoder)
     json_file.close()
 
 def load_json(filename):
@@ -14,7 +17,15 @@ def load_json(filename):
     json_file.close()
     return content
 
+def cache_dir(*subdirs):
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    path = os.path.join(base, 'gerador_de_fragmentos_timbrais', *subdirs)
+    os.makedirs(path, exist_ok=True)
+    return path
+
 def play_part(part_dict):
+    from scamp import wait
+
     events = part_dict['events']
     for pitch, dur in events:
         if pitch=='R':
@@ -22,7 +33,12 @@ def play_part(part_dict):
         else:
             part_dict['inst'].play_chord(pitch, 1, dur)
 
-def generate_neighbor(node, n, k, l, weights):
+def generate_neighbor(node, n, k, l, weights, sampler = None):
+    from app.engine import ExclusionSampler
+
+    # the sampler is built once per weight vector; without it every draw rebuilds the tables
+    if sampler is None:
+        sampler = ExclusionSampler(weights)
 
     bag = list(range(k))
     fixed_indices = []
@@ -38,31 +54,28 @@ def generate_neighbor(node, n, k, l, weights):
 
         if i in fixed_indices:
             neighbor.append(x)
-        
         else:
-            bag = list(range(1, x)) + list(range(x+1, n+1))
-            w = weights[:x-1] + weights[x:]
-            y = rd.choices( bag, w, k=1)[0]
-            neighbor.append(y)
+            neighbor.append(sampler.sample_excluding(x, rd.random()))
 
     return tuple(neighbor)
 
-    
-
 def generate_sequence(n, k, l, measures, weights=None):
+    from app.engine import ExclusionSampler
 
     if not weights:
         weights = [100/n]*n
 
+    sampler = ExclusionSampler(weights)
+
     bag = list(range(1,n+1))
 
-    print(bag, weights)
-    cur_node = tuple(rd.choices(bag, weights, k = k))
+    log.debug('symbols %s, weights %s', bag, weights)
+    cur_node = tuple(sampler.sample(rd.random()) for _ in range(k))
     sequence = [cur_node]
 
     for i in range(measures-1):
 
-        cur_node = generate_neighbor(cur_node, n, k, l, weights)
+        cur_node = generate_neighbor(cur_node, n, k, l, weights, sampler)
         sequence.append(cur_node)
     
-    return sequence
\ No newline at end of file
+    return sequence
@@ -1,4 +1,6 @@
-from app import main
+import sys
+
+from app.cli import run
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    sys.exit(run())
\ No newline at end of file